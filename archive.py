@@ -0,0 +1,168 @@
+"""Archives that hold many structures in one extended XYZ file.
+
+Each structure is one frame of the file: the atom count, a comment line with
+the lattice and the name of the structure, and one line per atom with its
+element and Cartesian position. An index file next to the archive, with the
+extension .idx added, has one line per frame giving its name, byte offset
+and byte length, so that single structures are read without scanning the
+archive. Processes append to the same archive under a file lock.
+
+Usage (extraction from the command line):
+    python archive.py ARCHIVE
+        Lists the structures in ARCHIVE.
+    python archive.py ARCHIVE NAME_OR_NUMBER OUTPUT_PATH [OCC WOBBLE]
+        Writes one structure to OUTPUT_PATH, in the format given by its
+        extension. The archive does not store the occupancy and wobble of
+        .ems files; they are taken from OCC and WOBBLE, or default to 1.0
+        and 0.0.
+"""
+import sys
+import os
+import re
+import fcntl
+import numpy as np
+import utilities as util
+from structure import Structure, element_symbols
+
+
+class StructureArchive(object):
+    """An archive opened for appending structures.
+
+    Attributes:
+        index_path (str): Path to the index file.
+        path (str): Path to the archive file.
+    """
+
+    def __init__(self, path):
+        """Opens an archive for appending, creating it when needed.
+
+        Args:
+            path (str): Path to the archive; '.xyz' is added when missing.
+        """
+        self.path = path if path.split('.')[-1] == 'xyz' else path + '.xyz'
+        self.index_path = self.path + '.idx'
+        self._file = open(self.path, 'ab')
+        self._index_file = open(self.index_path, 'ab')
+
+    def append(self, struct):
+        """Appends a structure as a new frame, named after its comment.
+
+        Args:
+            struct (Structure obj): The structure.
+
+        Returns:
+            int: Byte offset of the frame in the archive.
+        """
+        lattice = ' '.join(['%.16f' % x for x in struct.coordinates.ravel()])
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write('%d\nLattice="%s" Properties=species:S:1:pos:R:3 '
+                             'pbc="T T T" name="%s"\n' %
+                             (len(struct.element_codes), lattice,
+                              struct.comment))
+            util.write_rows(self._file, '%s %.16f %.16f %.16f\n',
+                            [element_symbols(struct.element_codes)] +
+                            list(struct.cartesian_pos.T))
+            self._file.flush()
+            length = self._file.tell() - offset
+            self._index_file.write('%s %d %d\n' %
+                                   (struct.comment, offset, length))
+            self._index_file.flush()
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        return offset
+
+    def close(self):
+        """Closes the archive.
+
+        Returns:
+            (void): Does not return.
+        """
+        self._file.close()
+        self._index_file.close()
+
+
+def read_index(path):
+    """Reads the index of an archive.
+
+    Args:
+        path (str): Path to the archive.
+
+    Returns:
+        (str, int, int) list: Name, byte offset and byte length of each
+            frame, in the order they were appended.
+    """
+    index = []
+    with open(path + '.idx', 'r') as in_file:
+        for line in in_file:
+            [name, offset, length] = line.split()
+            index.append((name, int(offset), int(length)))
+    return index
+
+
+def extract_structure(path, key):
+    """Reads one structure from an archive.
+
+    Args:
+        path (str): Path to the archive.
+        key (str or int): Name of the structure, or its number in the index.
+            When several frames have the name, the last one is read.
+
+    Returns:
+        Structure obj: The structure.
+
+    Raises:
+        ValueError: Raised when the structure is not in the archive.
+    """
+    index = read_index(path)
+    if isinstance(key, int):
+        if not -len(index) <= key < len(index):
+            raise ValueError('Structure %d not found in %s.' % (key, path))
+        entry = index[key]
+    else:
+        entries = [e for e in index if e[0] == key]
+        if len(entries) == 0:
+            raise ValueError('Structure %s not found in %s.' % (key, path))
+        entry = entries[-1]
+    with open(path, 'rb') as in_file:
+        in_file.seek(entry[1])
+        frame = in_file.read(entry[2])
+
+    [count, header, atoms] = frame.split('\n', 2)
+    coordinates = np.array(re.search(r'Lattice="([^"]*)"', header).group(1)
+                           .split(), dtype=float).reshape(3, 3)
+    atoms = np.array(atoms.split()).reshape(int(count), 4)
+    positions = np.dot(atoms[:, 1:4].astype(float),
+                       np.linalg.inv(coordinates))
+    return Structure(entry[0], 1.0, coordinates, positions, atoms[:, 0])
+
+
+def main(argv):
+    """The main function that will be called from command line.
+
+    Args:
+        argv (str list): A list of string arguments taken from command line,
+            see the usage in the module docstring.
+
+    Returns:
+        (void): Does not return.
+    """
+    if len(argv) == 2:
+        for (i, (name, _, _)) in enumerate(read_index(argv[1])):
+            print('%d  %s' % (i, name))
+    elif len(argv) in [4, 6]:
+        key = int(argv[2]) if re.match(r'^-?\d+$', argv[2]) else argv[2]
+        options = {'occ': 1.0, 'wobble': 0.0}
+        if len(argv) == 6:
+            options = {'occ': float(argv[4]), 'wobble': float(argv[5])}
+        struct = extract_structure(argv[1], key)
+        struct.to_file(argv[3], argv[3].split('.')[-1],
+                       overwrite_protect=False, **options)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv)
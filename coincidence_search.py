@@ -2,39 +2,244 @@
 """
 import numpy as np
 import geometry as geom
+from fractions import gcd
 
 
-def find_coincidence_points(box_1, box_2, max_int, tol):
+# Approximate number of bytes held per grid point while a block of the
+# coincidence point search is processed (integer multiples plus the
+# intermediate float arrays).
+SEARCH_BYTES_PER_POINT = 128
+
+
+def grid_block(multiples, start, stop):
+    """Gets a block of the 3-fold Cartesian product of an array by index.
+
+    Args:
+        multiples (nparray): The array, must be 1-D.
+        start (int): Index of the first row of the block.
+        stop (int): Index after the last row of the block.
+
+    Returns:
+        nparray: Rows start to stop of geom.cartesian_product(multiples, 3),
+            generated without building the full product (n * 3).
+    """
+    n = len(multiples)
+    idx = np.arange(start, stop)
+    return np.column_stack((multiples[idx // (n * n)],
+                            multiples[(idx // n) % n],
+                            multiples[idx % n]))
+
+
+def find_coincidence_points(box_1, box_2, max_int, tol, signed=False,
+                            memory_budget=64 * 2 ** 20):
     """Searches for coincidence points.
 
+    The grid of integer multiples is processed in blocks so that memory use is
+    bounded by memory_budget regardless of max_int.
+
     Args:
         box_1 (nparray): Coordinate system of a structure (3 * 3).
         box_2 (nparray): Coordinate system of another structure (3 * 3).
         max_int (int): Maximum integer to grow and search.
         tol (float): Tolerance of distance between coincidence points, in 
             proportion (should be between 0.0 and 1.0).
+        signed (bool, optional): When set to True, search multiples in range
+            (-max_int, max_int) instead of [0, max_int). Only one point of 
+            each pair v, -v is kept.
+        memory_budget (int, optional): Approximate number of bytes used by 
+            each block of the search.
 
     Returns:
-        nparray: A matrix of coincidence points (n * 3).
+        nparray: A matrix of coincidence points sorted by length (n * 3).
     """
-    search_points = geom.cartesian_product(np.arange(max_int), 3)
-    vecs = np.dot(search_points, box_1)
-    nearest_int_mult = np.rint(np.dot(vecs, np.linalg.inv(box_2)))
-    fitted_vecs = np.dot(nearest_int_mult, box_2)
-    diff_prop = np.absolute(vecs / (fitted_vecs + 1e-9)) - 1.0
-    # The addition of 1e-6 prevents division by zero.
-    max_diff_prop = np.apply_along_axis(np.max, 1, np.absolute(diff_prop))
-    print(max_diff_prop)
-    # The largest proportional difference in all 3 basis vectors.
-    vecs = vecs[np.where(max_diff_prop <= tol)]
-    vecs = vecs[np.argsort(np.apply_along_axis(np.linalg.norm, 1, vecs))]
-    return vecs[1:]
+    if signed:
+        multiples = np.arange(-max_int + 1, max_int)
+    else:
+        multiples = np.arange(max_int)
+    total = len(multiples) ** 3
+    block_size = max(1, int(memory_budget // SEARCH_BYTES_PER_POINT))
+    box_2_inv = np.linalg.inv(box_2)
 
+    res = []
+    for start in range(0, total, block_size):
+        search_points = grid_block(multiples, start,
+                                   min(start + block_size, total))
+        # Leave out the origin; in signed mode, keep only the point of each
+        # pair v, -v whose first non-zero multiple is positive.
+        nonzero = search_points != 0
+        keep = np.any(nonzero, axis=1)
+        if signed:
+            first_nonzero = search_points[np.arange(len(search_points)),
+                                          np.argmax(nonzero, axis=1)]
+            keep = np.logical_and(keep, first_nonzero > 0)
+        vecs = np.dot(search_points[keep], box_1)
+        nearest_int_mult = np.rint(np.dot(vecs, box_2_inv))
+        fitted_vecs = np.dot(nearest_int_mult, box_2)
+        # The addition of 1e-9 prevents division by zero.
+        diff_prop = np.absolute(vecs / (fitted_vecs + 1e-9)) - 1.0
+        # The largest proportional difference in all 3 basis vectors.
+        max_diff_prop = np.max(np.absolute(diff_prop), axis=1)
+        res.append(vecs[max_diff_prop <= tol])
 
-def find_overlattice(coincident_pts, min_agl, max_agl, min_vol, max_vol,
-                     max_pts=100, min_vec_len=0.):
-    """Searches for sets of three coincidence points and output the sets that
-    meets all the requirements.
+    vecs = np.concatenate(res)
+    # A stable sort keeps grid order among points of equal length.
+    return vecs[np.argsort(np.linalg.norm(vecs, axis=1), kind='mergesort')]
+
+
+def rational_approximation(mat, tol, max_denominator):
+    """Approximates a real matrix by integer matrix over a common denominator.
+
+    Args:
+        mat (nparray): A real matrix (n * m).
+        tol (float): Largest absolute difference allowed in each entry.
+        max_denominator (int): Largest denominator tried.
+
+    Returns:
+        nparray, int: The integer matrix p (n * m) and the smallest 
+            denominator q such that p / q is within tol of mat.
+
+    Raises:
+        ValueError: Raised when no denominator up to max_denominator 
+            approximates the matrix within tol.
+    """
+    denominators = np.arange(1, max_denominator + 1)
+    scaled = denominators[:, np.newaxis, np.newaxis] * mat
+    err = np.max(np.absolute(scaled - np.rint(scaled)), axis=(1, 2)) / \
+        denominators
+    fits = np.where(err <= tol)[0]
+    if len(fits) <= 0:
+        raise ValueError('No rational approximation with denominator up to '
+                         '%d found.' % max_denominator)
+    q = fits[0]
+    return np.rint(scaled[q]).astype(int), int(denominators[q])
+
+
+def find_csl_basis(box_1, box_2, tol=1e-3, max_denominator=100):
+    """Finds the coincidence site lattice of two lattices.
+
+    The transform between the two lattices is approximated by a rational 
+    matrix p / q. Integer multiples n of box_1 that are also integer 
+    multiples of box_2 satisfy n * p = 0 (mod q), and with the Smith normal
+    form u * p * v = d this becomes (n * u^-1) * d = 0 (mod q).
+
+    Args:
+        box_1 (nparray): Coordinate system of a structure (3 * 3).
+        box_2 (nparray): Coordinate system of another structure (3 * 3).
+        tol (float, optional): Largest absolute difference allowed in each 
+            entry of the rational approximation of the transform.
+        max_denominator (int, optional): Largest denominator tried in the 
+            rational approximation.
+
+    Returns:
+        nparray: An LLL-reduced basis of the coincidence site lattice, one 
+            vector on each row (3 * 3).
+    """
+    rel_trans, q = rational_approximation(
+        np.dot(box_1, np.linalg.inv(box_2)), tol, max_denominator)
+    d, u, _ = geom.smith_normal_form(rel_trans)
+    # Multiples along each Smith vector needed to reach a coincidence.
+    steps = np.array([q // gcd(int(d_i), q) for d_i in np.diag(d)])
+    csl_basis, _ = geom.lll_reduce(np.dot(steps[:, np.newaxis] * u, box_1))
+    return csl_basis
+
+
+def find_csl_points(box_1, box_2, max_int, tol=1e-3, max_denominator=100,
+                    memory_budget=64 * 2 ** 20):
+    """Searches for coincidence points by enumerating the short vectors of 
+        the coincidence site lattice.
+
+    Args:
+        box_1 (nparray): Coordinate system of a structure (3 * 3).
+        box_2 (nparray): Coordinate system of another structure (3 * 3).
+        max_int (int): Points are enumerated up to max_int times the longest
+            vector of box_1 in length.
+        tol (float, optional): Largest absolute difference allowed in each 
+            entry of the rational approximation of the transform.
+        max_denominator (int, optional): Largest denominator tried in the 
+            rational approximation.
+        memory_budget (int, optional): Approximate number of bytes used by 
+            each block of the enumeration.
+
+    Returns:
+        nparray: A matrix of coincidence points sorted by length, with only 
+            one point of each pair v, -v (n * 3).
+    """
+    csl_basis = find_csl_basis(box_1, box_2, tol, max_denominator)
+    radius = max_int * np.max(np.linalg.norm(box_1, axis=1))
+    # Any point within radius has coefficients bounded by radius times the
+    # length of the corresponding column of the inverse basis.
+    bound = int(np.ceil(radius * np.max(np.linalg.norm(
+        np.linalg.inv(csl_basis), axis=0))))
+    multiples = np.arange(-bound, bound + 1)
+    total = len(multiples) ** 3
+    block_size = max(1, int(memory_budget // SEARCH_BYTES_PER_POINT))
+
+    res = []
+    for start in range(0, total, block_size):
+        coeffs = grid_block(multiples, start, min(start + block_size, total))
+        nonzero = coeffs != 0
+        first_nonzero = coeffs[np.arange(len(coeffs)),
+                               np.argmax(nonzero, axis=1)]
+        vecs = np.dot(coeffs[first_nonzero > 0], csl_basis)
+        res.append(vecs[np.linalg.norm(vecs, axis=1) <= radius])
+
+    vecs = np.concatenate(res)
+    return vecs[np.argsort(np.linalg.norm(vecs, axis=1), kind='mergesort')]
+
+
+def primitive_points(coincident_pts, tol=1e-3):
+    """Collapses collinear coincidence points to the shortest one on each 
+        line through the origin, e.g. drops 2v, 3v and -v when v is present.
+
+    Args:
+        coincident_pts (nparray): A matrix of coincidence points (n * 3).
+        tol (float, optional): Directions are hashed by rounding the unit 
+            vectors to multiples of tol.
+
+    Returns:
+        nparray: The shortest point of each direction, in the order of the 
+            input (m * 3).
+    """
+    lengths = np.linalg.norm(coincident_pts, axis=1)
+    keys = np.rint(coincident_pts / (lengths[:, np.newaxis] * tol)).astype(
+        int)
+    # v and -v lie on the same line: make the first non-zero entry positive.
+    first_nonzero = keys[np.arange(len(keys)), np.argmax(keys != 0, axis=1)]
+    keys *= np.where(first_nonzero < 0, -1, 1)[:, np.newaxis]
+    order = np.argsort(lengths, kind='mergesort')
+    _, first = np.unique(keys[order], axis=0, return_index=True)
+    return coincident_pts[np.sort(order[first])]
+
+
+def box_volumes(boxes):
+    """Gets the volumes of lattice vector sets, the default score by which 
+        sets are ordered.
+
+    Args:
+        boxes (nparray): Lattice vector sets (n * 3 * 3).
+
+    Returns:
+        nparray: Volume of each set (n).
+    """
+    return np.absolute(np.linalg.det(boxes))
+
+
+def iter_overlattice(coincident_pts, min_agl, max_agl, min_vol, max_vol,
+                     max_pts=100, min_vec_len=0., gauss_reduced=False,
+                     primitive_only=False, score=box_volumes,
+                     chunk_size=2 ** 18, batch_size=1024):
+    """Searches for sets of three coincidence points and yields the sets that
+    meets all the requirements, from lowest to highest score.
+
+    The points are split up front into candidates for the c vector, which 
+    must be parallel to (0, 0, 1), and candidates for the a and b vectors. 
+    Each pair of a and b is combined with every c in vectorized form, one 
+    chunk at a time. Sets are yielded in batches: each pass over the chunks
+    keeps only the batch_size lowest-scoring sets after the last one 
+    yielded, so memory is bounded by one chunk and one batch. A consumer 
+    that stops within the first batch pays for one pass; each later batch
+    costs another pass. Sets of equal score keep the order they are found 
+    in.
     
     Args:
         coincident_pts (nparray): A matrix of coincidence points (n * 3).
@@ -50,50 +255,159 @@ def find_overlattice(coincident_pts, min_agl, max_agl, min_vol, max_vol,
             search for the set of three vectors.
         min_vec_len (float, optional): The minimum length of any vector,
             in angstrom.
+        gauss_reduced (bool, optional): When set to True, only use pairs of a 
+            and b whose projections on the x-y plane are Gauss-reduced.
+        primitive_only (bool, optional): When set to True, collinear points
+            are collapsed to the shortest one before the points are reduced
+            to max_pts.
+        score (function, optional): Maps lattice vector sets (n * 3 * 3) to 
+            their scores (n). Default is the volume.
+        chunk_size (int, optional): Approximate maximum number of sets 
+            checked at once.
+        batch_size (int, optional): Number of sets selected in each pass.
     
-    Returns:
-        nparray: An nparray consisting a list of 3-vector sets (n * 3 * 3).
+    Yields:
+        nparray: A 3-vector set (3 * 3).
     
     Raises:
         ValueError: Raised when the input coincidence point list has length
             less than 3 or no result can meet all requirements.
     """
+    if primitive_only and len(coincident_pts) > 0:
+        orig_count = len(coincident_pts)
+        coincident_pts = primitive_points(coincident_pts)
+        print('%d collinear coincident points removed.' %
+              (orig_count - len(coincident_pts)))
     if len(coincident_pts) < 3:
         raise ValueError('Must have at least 3 coincident points')
     if len(coincident_pts) > max_pts:
         print('Too many coincident points: %d reduced to %d.' % \
             (len(coincident_pts), max_pts))
         coincident_pts = coincident_pts[np.argsort(
-            np.apply_along_axis(np.linalg.norm, 1, coincident_pts))]
+            np.linalg.norm(coincident_pts, axis=1))]
         coincident_pts = coincident_pts[0:max_pts]
 
     print('Processing %d coincidence points.' % len(coincident_pts))
-    res = []  # Resulting lattice vectors: list of 3*3 nparrays.
-    for i in range(len(coincident_pts)):
-        for j in range(i + 1, len(coincident_pts)):
-            for k in range(j + 1, len(coincident_pts)):
-                lat_vecs = coincident_pts[[i, j, k]]
-                res.append(lat_vecs)
-    print('%d candidate lattice vector sets.' % len(res))
-    res = np.array(res)
-    # Check volume criterion.
-    vol = np.absolute(np.linalg.det(res))
-    res = res[np.logical_and(vol < max_vol, vol > min_vol)]
-    # Check vector lengths.
-    shortest_vec_len = np.apply_along_axis(np.linalg.norm, 2, res)
-    res = res[np.apply_along_axis(
-        np.all, 1, shortest_vec_len > min_vec_len)]
-    # Check angles.
-    vec_agls = np.array(map(geom.get_box_angles, res.tolist()))
-    res = res[np.apply_along_axis(
-        np.all, 1, np.logical_and(vec_agls > min_agl, vec_agls < max_agl))]
-    if len(res) <= 0:
-        raise ValueError('No lattice vector set that meets requirements.')
-    # Retain only results with c direction parallel to (0, 0, 1).
-    good_c = np.array(map(geom.box_good_c, res.tolist()))
-    res = res[good_c]
-    if len(res) <= 0:
-        raise ValueError('No lattice vector set that meets requirements.')
-    print('Totally %d qualified lattice vector sets found' % len(res))
-    # Sort the result from smallest to largest boxes.
-    return res[np.argsort(np.absolute(np.linalg.det(res)))]
+    # Points too short can never be used. A point along the z axis can only
+    # be the c vector, and any other point can only be a or b.
+    long_enough = np.linalg.norm(coincident_pts, axis=1) > min_vec_len
+    along_z = geom.parallel_to_z(coincident_pts)
+    c_pts = coincident_pts[np.logical_and(long_enough, along_z)]
+    ab_pts = coincident_pts[np.logical_and(long_enough,
+                                           np.logical_not(along_z))]
+    pair_i, pair_j = np.triu_indices(len(ab_pts), 1)
+    if gauss_reduced:
+        is_reduced = geom.gauss_reduced(ab_pts[pair_i, 0:2],
+                                        ab_pts[pair_j, 0:2])
+        pair_i, pair_j = pair_i[is_reduced], pair_j[is_reduced]
+    print('%d candidate lattice vector sets.' % (len(pair_i) * len(c_pts)))
+
+    pair_chunk = max(1, chunk_size // max(1, len(c_pts)))
+
+    def qualified_chunks():
+        # Yields the qualified sets of each chunk with their scores.
+        for start in range(0, len(pair_i), pair_chunk):
+            vec_a = ab_pts[pair_i[start:start + pair_chunk]]
+            vec_b = ab_pts[pair_j[start:start + pair_chunk]]
+            # Check volume criterion of each pair against each c at once.
+            vol = np.absolute(np.dot(np.cross(vec_a, vec_b), c_pts.T))
+            pair_idx, c_idx = np.nonzero(np.logical_and(vol < max_vol,
+                                                        vol > min_vol))
+            if len(pair_idx) <= 0:
+                continue
+            boxes = np.empty((len(pair_idx), 3, 3))
+            boxes[:, 0] = vec_a[pair_idx]
+            boxes[:, 1] = vec_b[pair_idx]
+            boxes[:, 2] = c_pts[c_idx]
+            # Check angles.
+            vec_agls = geom.get_boxes_angles(boxes)
+            boxes = boxes[np.all(np.logical_and(
+                vec_agls > min_agl, vec_agls < max_agl), axis=1)]
+            if len(boxes) > 0:
+                yield (boxes, score(boxes))
+
+    # Sets are ordered by score, then by the order they are found in; 
+    # (last_score, last_rank) is the last set yielded.
+    (last_score, last_rank) = (-np.inf, -1)
+    while True:
+        best_boxes = np.empty((0, 3, 3))
+        best_scores = np.empty(0)
+        best_ranks = np.empty(0, dtype=int)
+        found = 0
+        for (boxes, scores) in qualified_chunks():
+            ranks = np.arange(found, found + len(boxes))
+            found += len(boxes)
+            after = np.logical_or(scores > last_score, np.logical_and(
+                scores == last_score, ranks > last_rank))
+            best_boxes = np.concatenate((best_boxes, boxes[after]))
+            best_scores = np.concatenate((best_scores, scores[after]))
+            best_ranks = np.concatenate((best_ranks, ranks[after]))
+            order = np.lexsort((best_ranks, best_scores))[0:batch_size]
+            best_boxes = best_boxes[order]
+            best_scores = best_scores[order]
+            best_ranks = best_ranks[order]
+        if last_rank < 0:
+            if found <= 0:
+                raise ValueError(
+                    'No lattice vector set that meets requirements.')
+            print('Totally %d qualified lattice vector sets found' % found)
+        for box in best_boxes:
+            yield box
+        if len(best_boxes) < batch_size:
+            return
+        (last_score, last_rank) = (best_scores[-1], best_ranks[-1])
+
+
+def find_overlattice(coincident_pts, min_agl, max_agl, min_vol, max_vol,
+                     max_pts=100, min_vec_len=0., gauss_reduced=False,
+                     primitive_only=False, score=box_volumes,
+                     chunk_size=2 ** 18, batch_size=1024):
+    """Searches for sets of three coincidence points and output the sets that
+    meets all the requirements. See iter_overlattice for the arguments.
+    
+    Returns:
+        nparray: An nparray consisting a list of 3-vector sets sorted from 
+            lowest to highest score (n * 3 * 3).
+    
+    Raises:
+        ValueError: Raised when the input coincidence point list has length
+            less than 3 or no result can meet all requirements.
+    """
+    return np.array(list(iter_overlattice(
+        coincident_pts, min_agl, max_agl, min_vol, max_vol, max_pts=max_pts,
+        min_vec_len=min_vec_len, gauss_reduced=gauss_reduced,
+        primitive_only=primitive_only, score=score, chunk_size=chunk_size,
+        batch_size=batch_size)))
+
+
+def unique_lattices(boxes, basis):
+    """Drops lattice vector sets that give the same bicrystal as an earlier 
+        set, e.g. (a + b, b, c) after (a, b, c).
+
+    The two grains are stacked along c, so only sets with the same c and a 
+    and b spanning the same in-plane lattice are the same. The a and b rows, 
+    written in integer multiples of basis, are reduced to Hermite normal 
+    form, which is the same for every basis of a lattice; c is compared as 
+    it is.
+
+    Args:
+        boxes (iterable): Lattice vector sets (3 * 3), each made of integer 
+            multiples of basis.
+        basis (nparray): Coordinate system the coincidence points were 
+            generated from (3 * 3).
+
+    Yields:
+        nparray: The first lattice vector set of each distinct bicrystal 
+            (3 * 3).
+    """
+    basis_inv = np.linalg.inv(basis)
+    seen = set()
+    for box in boxes:
+        coeffs = np.rint(np.dot(box, basis_inv)).astype(int)
+        key = (geom.hermite_normal_form(coeffs[0:2]).tobytes(),
+               coeffs[2].tobytes())
+        if key in seen:
+            print('Duplicate lattice vector set skipped.')
+            continue
+        seen.add(key)
+        yield box
@@ -1,304 +1,382 @@
 """Routines to remove collision within a Structure object.
+
+A group of atoms is represented by a pair of arrays: positions (n * 3) and
+element codes (n), as stored in Structure objects.
 """
 import numpy as np
 import geometry as geom
+import kernels
+from structure import ELEMENT_SYMBOLS, element_codes
 
 
-def apart_by_safe_distance(min_dist_dict, atom_1, atom_2):
-    """Looks up the minimum distance dictionary and decide whether two atoms
-        are apart by safe distance by two atoms.
+def pair_cutoffs(min_dist_dict):
+    """Compiles the minimum distance dictionary into a matrix indexed by 
+        element codes.
 
     Args:
         min_dist_dict (dict): A dictionary where the key is tuple of atom type
             names and value is the minimum distance in angstrom.
-        atom_1 (nparray): A record array representing an atom.
-        atom_2 (nparray): A record array representing an atom.
 
     Returns:
-        bool: True if distance is safe, False otherwise.
+        nparray: A symmetric matrix where the entry at two element codes is 
+            the minimum distance in angstrom between atoms of the two 
+            elements, or 0 if the pair is not listed. When a pair is listed 
+            in both orders, the larger distance is used.
     """
-    dist = np.linalg.norm(atom_1['position'] - atom_2['position'])
-    try:
-        min_dist = min_dist_dict[(atom_1['element'], atom_2['element'])]
-    except KeyError, e:
-        try:
-            min_dist = min_dist_dict[(atom_2['element'], atom_1['element'])]
-        except KeyError, e:
-            return True
-        else:
-            return dist >= min_dist
-    else:
-        return dist >= min_dist
+    pairs = min_dist_dict.keys()
+    codes = element_codes([ele for pair in pairs for ele in pair])
+    cutoffs = np.zeros((len(ELEMENT_SYMBOLS), len(ELEMENT_SYMBOLS)))
+    for (i, pair) in enumerate(pairs):
+        (code_1, code_2) = codes[2 * i:2 * i + 2]
+        cutoffs[code_1, code_2] = max(cutoffs[code_1, code_2],
+                                      min_dist_dict[pair])
+    return np.maximum(cutoffs, cutoffs.T)
 
 
-def is_safe_distance(min_dist_dict, dist, ele_1, ele_2):
-    """Looks up the minimum distance dictionary and decide whether two atoms
-        are apart by safe distance by distance and atom element names.
+def is_safe_distance(cutoffs, dist, codes_1, codes_2):
+    """Decides whether atoms are apart by safe distance by distance and 
+        element codes.
 
     Args:
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
-        dist (float): Distance between atoms.
-        ele_1 (str): Element name of one atom.
-        ele_2 (TYPE): Element name of another atom.
+        cutoffs (nparray): Minimum distance matrix from pair_cutoffs().
+        dist (nparray): Distances between atoms.
+        codes_1 (nparray): Element codes of the atoms on one end, 
+            broadcastable against dist.
+        codes_2 (nparray): Element codes of the atoms on the other end, 
+            broadcastable against dist.
 
     Returns:
-        bool: True if distance is safe, False otherwise.
+        nparray: True where the distance is safe, False otherwise.
     """
-    try:
-        min_dist = min_dist_dict[(ele_1, ele_2)]
-    except KeyError, e:
-        try:
-            min_dist = min_dist_dict[(ele_2, ele_1)]
-        except KeyError, e:
-            return True
-        else:
-            return dist >= min_dist
-    else:
-        return dist >= min_dist
+    return dist >= cutoffs[codes_1, codes_2]
 
 
-def remove_collision_within_region(reg, min_dist_dict):
-    """Given a list of atoms, removes collision within the region.
+def colliding_pairs(cutoffs, pos_1, codes_1, pos_2, codes_2):
+    """Finds all pairs of atoms from two groups that are closer than safe 
+        distance.
 
     Args:
-        reg (nparray): Atoms, array of record arrays.
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
+        cutoffs (nparray): Minimum distance matrix from pair_cutoffs().
+        pos_1 (nparray): Positions of a group of atoms (n * 3).
+        codes_1 (nparray): Element codes of the group (n).
+        pos_2 (nparray): Positions of another group of atoms (m * 3).
+        codes_2 (nparray): Element codes of the other group (m).
 
     Returns:
-        nparray: The region of atoms with collisions removed: array of record
-            arrays.
+        (nparray, nparray): Indices into the first and the second group of 
+            each colliding pair.
     """
-    i = 0
-    while (i < len(reg) - 1):
-        prev = reg[0:i + 1]
-        atm = reg[i]
-        test = reg[i + 1:]
-        is_safe = np.array(map(lambda x: apart_by_safe_distance(
-            min_dist_dict, x, atm), test))
-        test = test[np.array(is_safe)]
-        reg = np.concatenate((prev, test))
-        i += 1
-    return reg
-
-
-def remove_collision_between_regions(reg_1, reg_2, min_dist_dict):
-    """Given two list of atoms, removes collision between two regions.
+    max_cutoff = np.max(cutoffs[np.ix_(np.unique(codes_1),
+                                       np.unique(codes_2))], initial=0.)
+    if max_cutoff <= 0:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    idx_1, idx_2 = geom.neighbor_pairs(pos_1, pos_2, max_cutoff)
+    collide = ~is_safe_distance(
+        cutoffs, np.linalg.norm(pos_1[idx_1] - pos_2[idx_2], axis=1),
+        codes_1[idx_1], codes_2[idx_2])
+    return (idx_1[collide], idx_2[collide])
+
+
+def keep_first(atom_count, earlier, later, backend='numpy'):
+    """Resolves collisions greedily in a given order: an atom is kept unless
+        it collides with an earlier atom that is kept.
 
     Args:
-        reg_1 (nparray): Atoms, array of record arrays.
-        reg_2 (nparray): Atoms, array of record arrays.
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
+        atom_count (int): Number of atoms.
+        earlier (nparray): For each colliding pair, the atom that comes 
+            first in the order (m).
+        later (nparray): For each colliding pair, the atom that comes later
+            in the order (m).
+        backend (str, optional): 'numpy' to resolve all atoms whose earlier
+            atoms are decided in rounds, or 'numba' to walk the atoms one by
+            one in a compiled loop.
 
     Returns:
-        nparray: reg_2 with all collision removed: array of record arrays.
+        nparray: Boolean array (atom_count), True for atoms that are kept.
     """
-    for atm in reg_1:
-        if len(reg_2) <= 0:
+    if backend == 'numba':
+        by_later = np.argsort(later, kind='mergesort')
+        starts = np.searchsorted(later[by_later], np.arange(atom_count + 1))
+        return kernels.keep_first_loop(starts, earlier[by_later],
+                                       np.empty(atom_count, dtype=bool))
+    # 1 for kept, -1 for removed and 0 for not yet decided. Each round 
+    # decides every atom whose earlier neighbors are all decided, so the 
+    # number of rounds is the length of the longest chain of collisions.
+    status = np.zeros(atom_count, dtype=int)
+    while True:
+        kept_before = np.zeros(atom_count, dtype=bool)
+        kept_before[later[status[earlier] == 1]] = True
+        status[np.logical_and(status == 0, kept_before)] = -1
+        open_before = np.zeros(atom_count, dtype=bool)
+        open_before[later[status[earlier] == 0]] = True
+        status[np.logical_and(status == 0, ~open_before)] = 1
+        # Collisions with a decided later atom no longer matter.
+        undecided = status[later] == 0
+        earlier = earlier[undecided]
+        later = later[undecided]
+        if len(later) <= 0:
             break
-        is_safe = np.array(map(lambda x: apart_by_safe_distance(
-                               min_dist_dict, x, atm), reg_2))
-        reg_2 = reg_2[is_safe]
-    return reg_2
+    return status >= 0
 
 
-def remove_collision_surface_pair(struct, boundary_radius, min_dist_dict,
-                                  dir_vec, random_delete=False):
-    """Removes collisions on opposite surfaces of a lattice vector set.
+def fewest_deletions(atom_count, earlier, later, max_rounds=100,
+                     backend='numpy'):
+    """Resolves collisions deleting as few atoms as possible, by a maximum 
+        independent set heuristic on the graph of colliding atoms.
+
+    Atoms of lowest degree among their undecided neighbors are kept and 
+    their neighbors removed, round by round, with ties broken by the given 
+    order. The result is then improved by swaps that trade one kept atom 
+    for two removed ones. The heuristic does not always win over keeping 
+    atoms in order, so the result of keep_first() is returned instead when 
+    it keeps more atoms.
 
     Args:
-        struct (Structure obj): The Structure object to remove collision.
-        boundary_radius (float): A proportion such that on each direction 
-            atoms within the distance of this proportion of lattice vector
-            length will be considered boundary atoms. 
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
-        dir_vec (nparray): A direction vector (3). Possible values are 
-            [1., 0., 0.], [0., 1., 0.], and [0., 0., 1.].
-        random_delete (bool, optional): When set to true, shuffle the list 
-            of atoms before removing collision.
+        atom_count (int): Number of atoms.
+        earlier (nparray): For each colliding pair, the atom that comes 
+            first in the order (m).
+        later (nparray): For each colliding pair, the atom that comes later
+            in the order (m).
+        max_rounds (int, optional): Maximum number of rounds of swaps.
+        backend (str, optional): Backend of keep_first(), 'numpy' or 
+            'numba'.
 
     Returns:
-        int: Number of atoms removed.
+        nparray: Boolean array (atom_count), True for atoms that are kept.
     """
-    orig_atom_count = len(struct.cartesian)
-
-    on_btm_idx = np.logical_and(
-        np.dot(struct.direct['position'], dir_vec) < (0.0 + boundary_radius),
-        np.dot(struct.direct['position'], dir_vec) > (0.0 - boundary_radius))
-    on_top_idx = np.logical_and(
-        np.dot(struct.direct['position'], dir_vec) < (1.0 + boundary_radius),
-        np.dot(struct.direct['position'], dir_vec) > (1.0 - boundary_radius))
-    btm_atoms = struct.cartesian[on_btm_idx]
-    if random_delete:
-        np.random.shuffle(btm_atoms)
-    top_atoms = struct.cartesian[on_top_idx]
-    if random_delete:
-        np.random.shuffle(top_atoms)
-    struct.cartesian = struct.cartesian[np.logical_not(
-        np.logical_or(on_btm_idx, on_top_idx))]
-    coord = np.dot(dir_vec, struct.coordinates)
-    top_atoms['position'] -= coord
-
-    # Remove atoms that are too close to each other within bottom or top slice.
-    top_atoms = remove_collision_within_region(top_atoms, min_dist_dict)
-    btm_atoms = remove_collision_within_region(btm_atoms, min_dist_dict)
-
-    # Remove atom collisions
-    btm_atoms = remove_collision_between_regions(top_atoms, btm_atoms,
-                                                 min_dist_dict)
-    top_atoms['position'] += coord
-
-    struct.cartesian = np.concatenate((struct.cartesian, btm_atoms))
-    struct.cartesian = np.concatenate((struct.cartesian, top_atoms))
-    struct.reconcile(according_to='C')
-
-    final_atom_count = len(struct.cartesian)
-    print(('%d atoms removed on surface on direction of ' +
-           str(dir_vec) + ' .') % (orig_atom_count - final_atom_count))
-    return orig_atom_count - final_atom_count
+    in_order = keep_first(atom_count, earlier, later, backend)
+    # Both directions of every collision, without repeats.
+    first = np.concatenate((earlier, later))
+    second = np.concatenate((later, earlier))
+    keys = np.unique(first.astype(np.int64) * atom_count + second)
+    (first, second) = (keys // atom_count, keys % atom_count)
+    neighbors = set(keys.tolist())
+    idx = np.arange(atom_count)
+
+    # Minimum degree elimination; an atom is kept when it comes before all 
+    # its undecided neighbors by degree, then by order.
+    status = np.zeros(atom_count, dtype=int)
+    while np.any(status == 0):
+        live = np.logical_and(status[first] == 0, status[second] == 0)
+        degree = np.bincount(first[live], minlength=atom_count)
+        priority = degree.astype(np.int64) * atom_count + idx
+        lowest = np.full(atom_count, np.iinfo(np.int64).max)
+        np.minimum.at(lowest, first[live], priority[second[live]])
+        pick = np.logical_and(status == 0, priority < lowest)
+        status[pick] = 1
+        status[second[np.logical_and(pick[first], status[second] == 0)]] = -1
+    kept = status == 1
+
+    for _ in range(max_rounds):
+        kept_count = np.bincount(first[kept[second]], minlength=atom_count)
+        # Removed atoms with no kept neighbor left can come back.
+        free = np.logical_and(~kept, kept_count == 0)
+        if np.any(free):
+            among = np.logical_and(free[first], free[second])
+            among = np.logical_and(among, first < second)
+            kept[np.logical_and(free, keep_first(
+                atom_count, first[among], second[among]))] = True
+            continue
+        # Removed atoms with exactly one kept neighbor, grouped by it. A 
+        # kept atom with two such atoms that do not collide is swapped out 
+        # for them. Swaps in one round must not touch each other.
+        tight = np.logical_and(kept[first], ~kept[second])
+        tight = np.logical_and(tight, kept_count[second] == 1)
+        owners = first[tight]
+        members = second[tight]
+        touched = np.zeros(atom_count, dtype=bool)
+        swapped = False
+        bounds = np.flatnonzero(np.diff(np.append(-1, owners)))
+        for (start, stop) in zip(bounds, np.append(bounds[1:], len(owners))):
+            owner = owners[start]
+            group = members[start:stop].tolist()
+            if len(group) < 2 or touched[owner] or np.any(touched[group]):
+                continue
+            pair = next(((v, w) for (i, v) in enumerate(group)
+                         for w in group[i + 1:]
+                         if v * atom_count + w not in neighbors), None)
+            if pair is None:
+                continue
+            kept[owner] = False
+            kept[list(pair)] = True
+            for atom in (owner,) + pair:
+                touched[atom] = True
+                touched[second[np.searchsorted(first, atom):
+                               np.searchsorted(first, atom, 'right')]] = True
+            swapped = True
+        if not swapped:
+            break
+    return kept if np.sum(kept) >= np.sum(in_order) else in_order
 
 
-def remove_collision_on_interface(struct, boundary_radius, min_dist_dict,
-                                  random_delete=False):
-    """Removes collisions on grain boundary (the interface).
+def keep_atoms(atom_count, earlier, later, strategy='greedy',
+               backend='numpy'):
+    """Decides which atoms to keep given the colliding pairs.
 
     Args:
-        struct (Structure obj): The Structure object to remove collision.
-        boundary_radius (float): A proportion such that on each direction 
-            atoms within the distance of this proportion of lattice vector
-            length will be considered boundary atoms. 
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
-        random_delete (bool, optional): When set to true, shuffle the list 
-            of atoms before removing collision.
+        atom_count (int): Number of atoms.
+        earlier (nparray): For each colliding pair, the atom that comes 
+            first in the order (m).
+        later (nparray): For each colliding pair, the atom that comes later
+            in the order (m).
+        strategy (str, optional): 'greedy' to keep atoms in order unless 
+            they collide with an earlier kept atom, see keep_first(), or 
+            'min_deletion' to delete as few atoms as possible, see 
+            fewest_deletions().
+        backend (str, optional): Backend of keep_first(), also used by 
+            fewest_deletions(), 'numpy' or 'numba'.
 
     Returns:
-        int: Number of atoms removed.
+        nparray: Boolean array (atom_count), True for atoms that are kept.
+
+    Raises:
+        ValueError: Raised when the strategy is not known.
     """
-    orig_atom_count = len(struct.cartesian)
+    if strategy == 'greedy':
+        return keep_first(atom_count, earlier, later, backend)
+    elif strategy == 'min_deletion':
+        return fewest_deletions(atom_count, earlier, later, backend=backend)
+    else:
+        raise ValueError('Removal strategy %s not found.' % strategy)
 
-    on_iface_idx = np.logical_and(
-        struct.direct['position'][:, 2] < (0.5 + boundary_radius),
-        struct.direct['position'][:, 2] > (0.5 - boundary_radius))
-    iface_atoms = struct.cartesian[on_iface_idx]
-    if random_delete:
-        np.random.shuffle(iface_atoms)
-    struct.cartesian = struct.cartesian[np.logical_not(on_iface_idx)]
-    struct.direct = struct.direct[np.logical_not(on_iface_idx)]
-    iface_atoms = remove_collision_within_region(iface_atoms, min_dist_dict)
 
-    struct.cartesian = np.concatenate((struct.cartesian, iface_atoms))
-    struct.reconcile(according_to='C')
+def remove_collision_at_boundaries(struct, boundary_radius, cutoffs,
+                                   random_delete=False, strategy='greedy',
+                                   backend='numpy'):
+    """Removes collisions among boundary atoms in a single pass.
 
-    final_atom_count = len(struct.cartesian)
-    print('%d atoms removed on interface.' %
-          (orig_atom_count - final_atom_count))
-    return orig_atom_count - final_atom_count
+    Boundary atoms are those within boundary_radius of a face of the 
+    lattice box or of the grain interface at c = 0.5. Each one near a face 
+    is also placed as a ghost at the periodic images across every face, 
+    edge and corner it is close to, so collisions across faces, edges and 
+    corners are found by one neighbor search. The collisions are then 
+    resolved by strategy, in atom order (shuffled when random_delete is set).
 
-def remove_collision_at_corners(struct, boundary_radius, min_dist_dict, 
-                                random_delete=False):
-    """Removes collisions at corners of structures.
-    
     Args:
         struct (Structure obj): The Structure object to remove collision.
         boundary_radius (float): A proportion such that on each direction 
             atoms within the distance of this proportion of lattice vector
             length will be considered boundary atoms. 
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
+        cutoffs (nparray): Minimum distance matrix from pair_cutoffs().
         random_delete (bool, optional): When set to true, shuffle the list 
             of atoms before removing collision.
-    
+        strategy (str, optional): Which atoms of colliding pairs to remove,
+            'greedy' or 'min_deletion', see keep_atoms().
+        backend (str, optional): Backend of keep_first(), 'numpy' or 
+            'numba'.
+
     Returns:
         int: Number of atoms removed.
     """
-    orig_atom_count = len(struct.cartesian)
-    dir_vecs = geom.cartesian_product(np.array([0., 1.]), 3)
-
-    corner_atoms = []
-    corner_indic = []
-
-    for dv in dir_vecs:
-        idx = np.logical_and(
-            np.apply_along_axis(np.all, 1, 
-                struct.direct['position'] < (dv + boundary_radius)), 
-            np.apply_along_axis(np.all, 1, 
-                struct.direct['position'] > (dv - boundary_radius)))
-        candidate_atoms = struct.cartesian[idx]
-        struct.cartesian = struct.cartesian[np.logical_not(idx)]
-        
-        for atm in candidate_atoms:
-            qualify = True
-            for i in range(len(corner_atoms)):
-                if not qualify:
-                    break
-                shift = np.dot(dv - corner_indic[i], struct.coordinates)
-                corner_atoms[i]['position'] += shift
-                if not apart_by_safe_distance(min_dist_dict, corner_atoms[i], 
-                                              atm):
-                    qualify = False
-                corner_atoms[i]['position'] -= shift
-            if qualify:    
-                corner_atoms.append(atm)
-                corner_indic.append(dv)
-
-        struct.reconcile(according_to='C')
-
-    if len(corner_atoms) > 0:
-        struct.cartesian = np.concatenate((struct.cartesian, 
-                                           np.array(corner_atoms)))
+    orig_atom_count = len(struct.direct_pos)
+    near_btm = struct.direct_pos < (0.0 + boundary_radius)
+    near_top = struct.direct_pos > (1.0 - boundary_radius)
+    near_iface = np.absolute(struct.direct_pos[:, 2] - 0.5) < boundary_radius
+    bound_idx = np.flatnonzero(np.logical_or(
+        np.any(np.logical_or(near_btm, near_top), axis=1), near_iface))
+    if random_delete:
+        np.random.shuffle(bound_idx)
+    bound_pos = struct.cartesian_pos[bound_idx]
+    bound_codes = struct.element_codes[bound_idx]
+    near_btm = near_btm[bound_idx]
+    near_top = near_top[bound_idx]
+
+    # Ghosts of each boundary atom, one for each combination of faces it is
+    # close to; an atom near the bottom face is shifted up, and vice versa.
+    ghost_pos = [bound_pos]
+    ghost_owner = [np.arange(len(bound_idx))]
+    for shift in geom.cartesian_product(np.array([-1, 0, 1]), 3):
+        if not np.any(shift):
+            continue
+        owner = np.flatnonzero(np.all(np.logical_or(
+            shift == 0, np.where(shift > 0, near_btm, near_top)), axis=1))
+        ghost_pos.append(bound_pos[owner] + np.dot(shift, struct.coordinates))
+        ghost_owner.append(owner)
+    ghost_owner = np.concatenate(ghost_owner)
+
+    first, second = colliding_pairs(cutoffs, bound_pos, bound_codes,
+                                    np.concatenate(ghost_pos),
+                                    bound_codes[ghost_owner])
+    second = ghost_owner[second]
+    # A collision may only be found from one side, against the ghost of the
+    # other atom; orient each pair by order instead of dropping one side.
+    distinct = first != second
+    first = first[distinct]
+    second = second[distinct]
+    keep = np.ones(orig_atom_count, dtype=bool)
+    keep[bound_idx] = keep_atoms(len(bound_idx), np.minimum(first, second),
+                                 np.maximum(first, second), strategy, backend)
+    struct.cartesian_pos = struct.cartesian_pos[keep]
+    struct.element_codes = struct.element_codes[keep]
     struct.reconcile(according_to='C')
 
-    final_atom_count = len(struct.cartesian)
-    print('%d atoms removed at corners.' % \
-        (orig_atom_count - final_atom_count))
+    final_atom_count = len(struct.direct_pos)
+    print('%d atoms removed at boundaries.' %
+          (orig_atom_count - final_atom_count))
     return orig_atom_count - final_atom_count
 
-def min_image_remove_collision(struct, min_dist_dict, random_delete=False):
+
+def min_image_remove_collision(struct, cutoffs, random_delete=False,
+                               strategy='greedy', backend='numpy'):
     """Use minimum image convention algorithm to remove collision.
 
+    Candidate pairs come from a cell list, so the work grows about linearly
+    with the number of atoms. The collisions are then resolved by strategy,
+    in atom order (shuffled when random_delete is set).
+
     Args:
         struct (Structure obj): The Structure object to remove collision.
-        min_dist_dict (dict): A dictionary where the key is tuple of atom type
-            names and value is the minimum distance in angstrom.
+        cutoffs (nparray): Minimum distance matrix from pair_cutoffs().
         random_delete (bool, optional): When set to true, shuffle the list 
             of atoms before removing collision.
+        strategy (str, optional): Which atoms of colliding pairs to remove,
+            'greedy' or 'min_deletion', see keep_atoms().
+        backend (str, optional): Backend of keep_first(), 'numpy' or 
+            'numba'.
 
     Returns:
         int: Number of atoms removed.
     """
-    orig_atom_count = len(struct.direct)
-    good_direct = []
+    orig_atom_count = len(struct.direct_pos)
+    order = np.arange(orig_atom_count)
     if random_delete:
-        np.random.shuffle(struct.cartesian)
-    for i in range(len(struct.cartesian)):
-        qualified = True
-        for j in range(len(good_direct)):
-            if not qualified:
-                break
-            diff = good_direct[j]['position'] - struct.direct[i]['position']
-            diff = np.array(map(lambda x: x + 1.0 if x < -0.5 else
-                                (x - 1.0 if x > 0.5 else x), diff.tolist()))
-            diff = np.linalg.norm(np.dot(diff, struct.coordinates))
-            if not is_safe_distance(min_dist_dict, diff,
-                                    good_direct[j]['element'], struct.direct[i]['element']):
-                qualified = False
-
-        if qualified:
-            good_direct.append(struct.direct[i])
-
-    good_direct = np.array(good_direct)
-    struct.direct = good_direct
+        np.random.shuffle(order)
+    max_cutoff = np.max(cutoffs[np.ix_(np.unique(struct.element_codes),
+                                       np.unique(struct.element_codes))],
+                        initial=0.)
+    if max_cutoff > 0:
+        pair_1, pair_2 = geom.periodic_neighbor_pairs(
+            struct.direct_pos, struct.coordinates, max_cutoff)
+        diff = struct.direct_pos[pair_2] - struct.direct_pos[pair_1]
+        # Minimum image: wrap each component into [-0.5, 0.5].
+        diff += (diff < -0.5).astype(float) - (diff > 0.5)
+        diff = np.linalg.norm(np.dot(diff, struct.coordinates), axis=1)
+        collide = ~is_safe_distance(cutoffs, diff,
+                                    struct.element_codes[pair_1],
+                                    struct.element_codes[pair_2])
+        pair_1 = pair_1[collide]
+        pair_2 = pair_2[collide]
+        # Orient each pair by the order atoms are considered in.
+        rank = np.empty(orig_atom_count, dtype=int)
+        rank[order] = np.arange(orig_atom_count)
+        swap = rank[pair_1] > rank[pair_2]
+        earlier = np.where(swap, rank[pair_2], rank[pair_1])
+        later = np.where(swap, rank[pair_1], rank[pair_2])
+        good_idx = order[keep_atoms(orig_atom_count, earlier, later,
+                                    strategy, backend)]
+    else:
+        good_idx = order
+
+    struct.direct_pos = struct.direct_pos[good_idx]
+    struct.element_codes = struct.element_codes[good_idx]
     struct.reconcile(according_to='D')
-    final_atom_count = len(struct.direct)
+    final_atom_count = len(struct.direct_pos)
     return final_atom_count - orig_atom_count
 
 
 def remove_collision(struct, boundary_radius, min_dist_dict, fast=True,
-                     random_delete=False):
+                     random_delete=False, strategy='greedy',
+                     backend='numpy'):
     """Removes collision within a Structure object.
 
     Args:
@@ -312,24 +390,24 @@ def remove_collision(struct, boundary_radius, min_dist_dict, fast=True,
             otherwise, use the minimum image convention method.
         random_delete (bool, optional): When set to true, shuffle the list 
             of atoms before removing collision.
+        strategy (str, optional): Which atoms of colliding pairs to remove,
+            'greedy' or 'min_deletion', see keep_atoms().
+        backend (str, optional): Backend of keep_first(), 'numpy' or 
+            'numba'.
 
     Returns:
         int: Number of atoms removed.
     """
-    orig_atom_count = struct.cartesian.shape[0]
+    orig_atom_count = struct.cartesian_pos.shape[0]
+    cutoffs = pair_cutoffs(min_dist_dict)
 
     if fast:
-        remove_collision_on_interface(struct, boundary_radius, min_dist_dict,
-                                      random_delete)
-        for dir_vec in np.identity(3):
-            remove_collision_surface_pair(struct, boundary_radius,
-                                          min_dist_dict, dir_vec,
-                                          random_delete)
-        remove_collision_at_corners(struct, boundary_radius, min_dist_dict,
-                                    random_delete)
+        remove_collision_at_boundaries(struct, boundary_radius, cutoffs,
+                                       random_delete, strategy, backend)
     else:
-        min_image_remove_collision(struct, min_dist_dict)
+        min_image_remove_collision(struct, cutoffs, random_delete, strategy,
+                                   backend)
 
-    final_atom_count = struct.cartesian.shape[0]
+    final_atom_count = struct.cartesian_pos.shape[0]
     print('%d atoms removed in total.' % (orig_atom_count - final_atom_count))
     return orig_atom_count - final_atom_count
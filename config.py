@@ -14,16 +14,40 @@ class Configuration(object):
             final structure.
         boundary_radius (float): The proportion of lattice vector length such 
             that atoms within this distance will be considered boundary atoms.
+        box_parallelism (int): Number of processes building the structures 
+            of the lattice vector sets of an entry of gb_settings, used when 
+            parallelism is 1.
+        coincidence_engine (str): Method used to find coincidence points, 
+            either 'grid' for a search over integer multiples of the lattice 
+            vectors, or 'csl' for enumeration of the coincidence site 
+            lattice.
+        coincident_pts_memory_budget (float): Approximate memory, in MB, 
+            used by each block of the coincidence point search.
         coincident_pts_search_step (int): Number of multiples tried to 
-            replicate one structure when searching for coincidence points.
+            replicate one structure when searching for coincidence points. 
+            For the 'csl' engine, points up to this many times the longest 
+            lattice vector in length are enumerated.
+        coincident_pts_signed_search (bool): When set to True, also search 
+            negative multiples when searching for coincidence points.
         coincident_pts_tolerance (float): The tolerance of distance between 
             two points that are considered coincidence points, in proportion.
+        csl_max_denominator (int): Largest denominator tried when 
+            approximating the transform between the two lattices by a 
+            rational matrix, used by the 'csl' engine.
+        csl_tolerance (float): Largest absolute difference allowed in each 
+            entry of the rational approximation, used by the 'csl' engine.
         fast_removal (bool): When set to True, only consider boundary atoms in 
             collision removal; otherwise use minimum image convention 
             algorithm to search for each pair of atoms within the structure.
         gb_settings (mixed list): A list of lists of format 
             [struct 1 orientation, struct 2 orientation, twisting angle, 
             tilt_boolean, tilt viewing angle, tilt degree] to specify each run of the algorithm.
+        gauss_reduced_pairs (bool): When set to True, only pairs of a and b 
+            lattice vectors whose projections on the x-y plane are 
+            Gauss-reduced are used when searching for lattice vector sets.
+        kernel_backend (str): Backend of the collision removal and closed-
+            form supercell tiling kernels, either 'numpy' or 'numba'. Falls 
+            back to 'numpy' when Numba is not installed.
         lattice_vec_agl_range (tuple): The minimum and maximum angles allowed 
             between any vector and the plane formed by the other two vectors, 
             in rad.
@@ -34,6 +58,9 @@ class Configuration(object):
         min_vec_length (float): Minimum length of lattice vectors.
         mutual_view_agl_tolerance (float): Tolerance of the angle between two 
             angles that are considered mutual angles, in rad.
+        output_archive (str): When not empty, all structures of the run are 
+            appended to the extended XYZ archive of this name in output_dir,
+            instead of one file each in output_format.
         output_dir (str): Name of output directory.
         output_format (str): Output file extension, currently only 'vasp', 
             'xyz', and 'ems' supported.
@@ -43,14 +70,36 @@ class Configuration(object):
         output_name_prefix (str): The prefix added to each output file.
         output_options (dict): Keyword arguments required for certain file 
             types.
+        output_queue_size (int): Number of finished structures that may wait
+            for a background writer thread; when 0, structures are written 
+            before the next one is built.
         overwrite_protect (bool): When set to True, if the file to be written 
             exists, find a new filename instead of overwriting the original.
+        parallelism (int): Number of processes over which the entries of 
+            gb_settings are spread.
+        primitive_coincident_pts (bool): When set to True, collinear 
+            coincidence points are collapsed to the shortest one before 
+            searching for lattice vector sets.
         random_delete_atom (bool): When set to True, shuffle atom list before 
             collision removal.
+        removal_strategy (str): Which atoms of colliding pairs are removed, 
+            either 'greedy' to keep atoms in order unless they collide with
+            an earlier kept atom, or 'min_deletion' to remove as few atoms 
+            as possible.
         skip_collision_removal (bool): When set to True, skip collision 
             removal routine.
         struct_1 (str): Path to the input file of a structure.
         struct_2 (str): Path to the input file of another structure.
+        structure_cache (bool): When set to True, input structures are read
+            through a binary cache kept next to each input file.
+        supercell_tiling (str): Method used to grow structures to a lattice 
+            box, either 'search' to search image cells outwards until enough 
+            atoms are found, or 'closed_form' to tile every image cell 
+            overlapping the box at once, keeping one copy of atoms on its 
+            faces.
+        unique_lattices (bool): When set to True, lattice vector sets with 
+            the same c as an earlier set and whose a and b span the same 
+            in-plane lattice are skipped.
         view_agl_count (int): Number of viewing angles to recommend for each 
             structure.
     """
@@ -67,17 +116,30 @@ class Configuration(object):
         self.struct_2 = struct_2
         self.gb_settings = []
         self.view_agl_count = 10
+        self.structure_cache = False
         self.mutual_view_agl_tolerance = 0.0873
+        self.kernel_backend = 'numpy'
+        self.parallelism = 1
+        self.box_parallelism = 1
 
         # Coincident point search.
+        self.coincidence_engine = 'grid'
         self.coincident_pts_tolerance = 0.2
         self.coincident_pts_search_step = 25
+        self.coincident_pts_signed_search = False
+        self.coincident_pts_memory_budget = 64.0
+        self.csl_tolerance = 1e-3
+        self.csl_max_denominator = 100
 
         # Lattice vector generation.
         self.max_coincident_pts_searched = 100
         self.lattice_vec_agl_range = (0, PI / 2)
         self.min_vec_length = 0.0
         self.atom_count_range = (0, 10000)
+        self.gauss_reduced_pairs = False
+        self.primitive_coincident_pts = False
+        self.unique_lattices = False
+        self.supercell_tiling = 'search'
 
         # Collision removal.
         self.skip_collision_removal = False
@@ -85,13 +147,16 @@ class Configuration(object):
         self.min_atom_dist = {}
         self.boundary_radius = 0.01
         self.random_delete_atom = False
+        self.removal_strategy = 'greedy'
 
         # Output format.
         self.output_format = 'vasp'
+        self.output_archive = ''
         self.output_options = {}
         self.output_max_count = 10
         self.output_dir = ''
         self.output_name_prefix = ''
+        self.output_queue_size = 0
         self.overwrite_protect = True
 
     def __str__(self):
@@ -153,17 +218,39 @@ class Configuration(object):
         if 'view_agl_count' in keys:
             config_object.view_agl_count = float(parsed_json['view_agl_count'])
 
+        if 'structure_cache' in keys:
+            config_object.structure_cache = parsed_json['structure_cache']
         if 'mutual_view_agl_tolerance' in keys:
             config_object.mutual_view_agl_tolerance = \
                 np.deg2rad(float(parsed_json['mutual_view_agl_tolerance']))
+        if 'kernel_backend' in keys:
+            config_object.kernel_backend = parsed_json['kernel_backend']
+        if 'parallelism' in keys:
+            config_object.parallelism = int(parsed_json['parallelism'])
+        if 'box_parallelism' in keys:
+            config_object.box_parallelism = int(parsed_json['box_parallelism'])
 
         # Coincident point search parameters.
+        if 'coincidence_engine' in keys:
+            config_object.coincidence_engine = \
+                parsed_json['coincidence_engine']
         if 'coincident_pts_tolerance' in keys:
             config_object.coincident_pts_tolerance = \
                 float(parsed_json['coincident_pts_tolerance'])
         if 'coincident_pts_search_step' in keys:
             config_object.coincident_pts_search_step = \
                 int(parsed_json['coincident_pts_search_step'])
+        if 'coincident_pts_signed_search' in keys:
+            config_object.coincident_pts_signed_search = \
+                parsed_json['coincident_pts_signed_search']
+        if 'coincident_pts_memory_budget' in keys:
+            config_object.coincident_pts_memory_budget = \
+                float(parsed_json['coincident_pts_memory_budget'])
+        if 'csl_tolerance' in keys:
+            config_object.csl_tolerance = float(parsed_json['csl_tolerance'])
+        if 'csl_max_denominator' in keys:
+            config_object.csl_max_denominator = \
+                int(parsed_json['csl_max_denominator'])
 
         # Lattice vector generation parameters.
         if 'max_coincident_pts_searched' in keys:
@@ -179,6 +266,16 @@ class Configuration(object):
             config_object.atom_count_range = \
                 (float(parsed_json['atom_count_range'][0]),
                  float(parsed_json['atom_count_range'][1]))
+        if 'gauss_reduced_pairs' in keys:
+            config_object.gauss_reduced_pairs = \
+                parsed_json['gauss_reduced_pairs']
+        if 'primitive_coincident_pts' in keys:
+            config_object.primitive_coincident_pts = \
+                parsed_json['primitive_coincident_pts']
+        if 'unique_lattices' in keys:
+            config_object.unique_lattices = parsed_json['unique_lattices']
+        if 'supercell_tiling' in keys:
+            config_object.supercell_tiling = parsed_json['supercell_tiling']
 
         # Collision removal parameters.
         if 'skip_collision_removal' in keys:
@@ -198,10 +295,14 @@ class Configuration(object):
         if 'random_delete_atom' in keys:
             config_object.random_delete_atom = \
                 parsed_json['random_delete_atom']
+        if 'removal_strategy' in keys:
+            config_object.removal_strategy = parsed_json['removal_strategy']
 
         # Output format parameters.
         if 'output_format' in keys:
             config_object.output_format = parsed_json['output_format']
+        if 'output_archive' in keys:
+            config_object.output_archive = parsed_json['output_archive']
         if 'output_options' in keys:
             config_object.output_options = parsed_json['output_options']
         if 'output_max_count' in keys:
@@ -212,6 +313,9 @@ class Configuration(object):
         if 'output_name_prefix' in keys:
             config_object.output_name_prefix = \
                 parsed_json['output_name_prefix']
+        if 'output_queue_size' in keys:
+            config_object.output_queue_size = \
+                int(parsed_json['output_queue_size'])
         if 'overwrite_protect' in keys:
             config_object.overwrite_protect = parsed_json['overwrite_protect']
 
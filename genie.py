@@ -2,150 +2,584 @@
 """
 import sys
 import os
-import copy
 import numpy as np
 import traceback
+import multiprocessing
+import collections
+import functools
 from structure import Structure
 from config import Configuration
 import geometry as geom
 import collision_removal as coll_rmvl
 import coincidence_search as coin_srch
+import kernels
+import transport
+import structure_cache
+from archive import StructureArchive
+from writer import BackgroundWriter
 from math import pi as PI
 
 
 def genie(conf):
     """Executes the Grain-Boundary Genie routine based on Configuration object.
 
+    Each entry of gb_settings is independent. With conf.parallelism above 1 
+    they are spread over a pool of processes, which map the original 
+    structures read by this process from shared files. Otherwise, with 
+    conf.box_parallelism above 1, the lattice vector sets of each entry are 
+    built by a pool of processes.
+    Errors are collected per entry and reported after all entries are done.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+
+    Returns:
+        (int, str) list: Index into gb_settings and description of each 
+            error encountered.
+    """
+    # Check and create folder for output files.
+    if len(conf.output_dir) != 0:
+        if not os.path.isdir(conf.output_dir):
+            os.mkdir(conf.output_dir)
+
+    (orig_1, orig_2) = load_structures(conf)
+    jobs = min(conf.parallelism, len(conf.gb_settings))
+    if jobs > 1:
+        directory = transport.make_directory()
+        try:
+            handle_1 = transport.share_structure(orig_1, directory)
+            handle_2 = handle_1
+            if orig_2 is not orig_1:
+                handle_2 = transport.share_structure(orig_2, directory)
+            pool = multiprocessing.Pool(
+                jobs, initializer=init_worker,
+                initargs=(conf, directory, None, (handle_1, handle_2)))
+            try:
+                results = pool.map(run_gb_setting_in_worker,
+                                   range(len(conf.gb_settings)), chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            transport.remove_directory(directory)
+    else:
+        backend = kernels.select_backend(conf.kernel_backend)
+        archive = open_archive(conf)
+        writer = open_writer(conf)
+        box_pool = None
+        if conf.box_parallelism > 1:
+            box_pool = BoxPool(conf, conf.box_parallelism)
+        try:
+            results = [run_gb_setting(conf, orig_1, orig_2, setting, backend,
+                                      box_pool, archive, writer)
+                       for setting in conf.gb_settings]
+        finally:
+            if box_pool is not None:
+                box_pool.close()
+            # Pending structures are written out even when a run fails.
+            if writer is not None:
+                writer.close()
+            if archive is not None:
+                archive.close()
+
+    errors = [(i, error) for (i, setting_errors) in enumerate(results)
+              for error in setting_errors]
+    for (i, error) in errors:
+        print('Error in gb_settings entry %d: %s' % (i, error))
+    return errors
+
+
+def open_archive(conf):
+    """Opens the archive that the structures of a run are appended to.
+
     Args:
         conf (Configuration object): Contains specifications of the run.
 
+    Returns:
+        StructureArchive obj: The archive, or None when conf.output_archive
+            is empty.
+    """
+    if len(conf.output_archive) == 0:
+        return None
+    return StructureArchive(os.path.join(conf.output_dir, conf.output_archive))
+
+
+def open_writer(conf):
+    """Starts the background writer of a run.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+
+    Returns:
+        BackgroundWriter obj: The writer, or None when 
+            conf.output_queue_size is 0 and structures are written inline.
+    """
+    if conf.output_queue_size <= 0:
+        return None
+    return BackgroundWriter(conf.output_queue_size)
+
+
+def write_structure(conf, struct, file_name, archive=None):
+    """Writes a finished structure, named after its comment.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+        struct (Structure obj): The structure.
+        file_name (str): Path of the output file, without extension.
+        archive (StructureArchive obj, optional): Archive to append the 
+            structure to, instead of writing a file.
+
     Returns:
         (void): Does not return.
     """
-    # First read in the input files.
+    if archive is not None:
+        archive.append(struct)
+    else:
+        struct.to_file(file_name, conf.output_format,
+                       overwrite_protect=conf.overwrite_protect,
+                       **conf.output_options)
+
+
+def load_structures(conf):
+    """Reads the two original structures of a run, through the structure 
+        cache when conf.structure_cache is set.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+
+    Returns:
+        Structure obj, Structure obj: The two structures; the same object 
+            twice when both paths are the same.
+    """
+    read = Structure.from_file
+    if conf.structure_cache:
+        read = structure_cache.from_file
+    orig_1 = read(conf.struct_1, view_agl_count=conf.view_agl_count)
     if conf.struct_1 == conf.struct_2:
-        orig_1 = Structure.from_file(conf.struct_1,
-                                     view_agl_count=conf.view_agl_count)
-        orig_2 = copy.deepcopy(orig_1)
+        orig_2 = orig_1
     else:
-        orig_1 = Structure.from_file(conf.struct_1,
-                                     view_agl_count=conf.view_agl_count)
-        orig_2 = Structure.from_file(conf.struct_2,
-                                     view_agl_count=conf.view_agl_count)
+        orig_2 = read(conf.struct_2, view_agl_count=conf.view_agl_count)
+    return orig_1, orig_2
+
+
+# State of a worker process, set once by init_worker().
+WORKER_STATE = {}
+
+
+def init_worker(conf, directory, cancelled=None, handles=None):
+    """Initializes a worker process: maps the original structures and 
+        selects the kernel backend.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+        directory (str): Directory for the files of shared structures.
+        cancelled (multiprocessing.Value, optional): Shared counter; tasks 
+            with a token up to its value are cancelled.
+        handles (StructureHandle obj tuple, optional): Handles to the two 
+            original structures.
+
+    Returns:
+        (void): Does not return.
+    """
+    WORKER_STATE['conf'] = conf
+    WORKER_STATE['directory'] = directory
+    WORKER_STATE['cancelled'] = cancelled
+    if handles is not None:
+        orig_1 = transport.attach_structure(handles[0])
+        orig_2 = orig_1
+        if handles[1].path != handles[0].path:
+            orig_2 = transport.attach_structure(handles[1])
+        WORKER_STATE['structures'] = (orig_1, orig_2)
+        WORKER_STATE['archive'] = open_archive(conf)
+        WORKER_STATE['writer'] = open_writer(conf)
+    WORKER_STATE['backend'] = kernels.select_backend(conf.kernel_backend)
+
+
+def run_gb_setting_in_worker(index):
+    """Runs one entry of gb_settings in a worker process.
+
+    Args:
+        index (int): Index of the entry in gb_settings.
+
+    Returns:
+        str list: Descriptions of the errors encountered.
+    """
+    conf = WORKER_STATE['conf']
+    (orig_1, orig_2) = WORKER_STATE['structures']
+    writer = WORKER_STATE['writer']
+    try:
+        return run_gb_setting(conf, orig_1, orig_2, conf.gb_settings[index],
+                              WORKER_STATE['backend'],
+                              archive=WORKER_STATE['archive'], writer=writer)
+    finally:
+        # The errors of the writes are returned with the entry.
+        if writer is not None:
+            writer.flush()
+
+
+def run_gb_setting(conf, orig_1, orig_2, setting, backend, box_pool=None,
+                   archive=None, writer=None):
+    """Produces and writes the structures of one entry of gb_settings.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+        orig_1 (Structure obj): The first original structure.
+        orig_2 (Structure obj): The second original structure.
+        setting (mixed list): The entry of gb_settings, of format 
+            [struct 1 orientation, struct 2 orientation, twisting angle, 
+            tilt_boolean, tilt viewing angle, tilt degree].
+        backend (str): Kernel backend, as given by kernels.select_backend().
+        box_pool (BoxPool obj, optional): Pool of workers to build the 
+            structures of the lattice vector sets in.
+        archive (StructureArchive obj, optional): Archive to append the 
+            structures to, instead of writing one file each.
+        writer (BackgroundWriter obj, optional): Writer to hand the 
+            structures to; the errors of its writes are appended to the 
+            returned list once they are done.
+
+    Returns:
+        str list: Descriptions of the errors encountered.
+    """
+    [orien_1, orien_2, twist_agl, tilt, const_view_agl, tilt_agl] = setting
+    errors = []
 
     # Calculate min and max volume based on
-    atom_count_unit_vol = (len(orig_1.direct) + len(orig_2.direct)) / \
+    atom_count_unit_vol = (len(orig_1.direct_pos) + len(orig_2.direct_pos)) / \
         (abs(np.linalg.det(orig_1.coordinates)) +
          abs(np.linalg.det(orig_2.coordinates)))
     min_vol = 0.5 * conf.atom_count_range[0] / atom_count_unit_vol
     max_vol = 0.5 * conf.atom_count_range[1] / atom_count_unit_vol
 
-    # Check and create folder for output files.
-    if len(conf.output_dir) != 0:
-        if not os.path.isdir(conf.output_dir):
-            os.mkdir(conf.output_dir)
-
-    # For each configuration in gb_settings, produce the simulated structures.
-    for [orien_1, orien_2, twist_agl, tilt, const_view_agl, tilt_agl] in conf.gb_settings:
-        # Make deep copies of the original structures.
-        struct_1 = copy.deepcopy(orig_1)
-        struct_2 = copy.deepcopy(orig_2)
+    try:
+        # Generate transformation matrices.
+        trans_1 = np.dot(
+            geom.rotation_angle_matrix(np.array([0., 0., 1.]), twist_agl), 
+            geom.get_rotation_matrix(orien_1, np.array([0., 0., 1.])))
+        trans_2 = geom.get_rotation_matrix(orien_2, np.array([0., 0., 1.]))
+        if tilt:
+            trans_2 = np.dot(trans_2,
+                geom.rotation_angle_matrix(const_view_agl, tilt_agl))
 
-        try:
-            # Generate transformation matrices.
-            trans_1 = np.dot(
-                geom.rotation_angle_matrix(np.array([0., 0., 1.]), twist_agl), 
-                geom.get_rotation_matrix(orien_1, np.array([0., 0., 1.])))
-            trans_2 = geom.get_rotation_matrix(orien_2, np.array([0., 0., 1.]))
-            if tilt:
-                trans_2 = np.dot(trans_2,
-                    geom.rotation_angle_matrix(const_view_agl, tilt_agl))
-
-            # Transform structures.
-            struct_1.transform(trans_1)
-            struct_2.transform(trans_2)
-            # Find mutual viewing angle and generate a matrix that will turn
-            # the mutual viewing angle into the direction of [1, 0, 0].
-            if tilt:
-                mutual_view_agl = const_view_agl
-            else:
-                mutual_view_agl = Structure.find_mutual_viewing_angle(
-                    struct_1, struct_2, tol=conf.mutual_view_agl_tolerance)
-            mat_turn_mutual = geom.get_rotation_matrix(
-                mutual_view_agl, np.array([1., 0., 0.]))
-            # Find coincident points.
+        # Transform structures; the originals are left as they are.
+        struct_1 = orig_1.transform(trans_1)
+        struct_2 = orig_2.transform(trans_2)
+        # Find mutual viewing angle and generate a matrix that will turn
+        # the mutual viewing angle into the direction of [1, 0, 0].
+        if tilt:
+            mutual_view_agl = const_view_agl
+        else:
+            mutual_view_agl = Structure.find_mutual_viewing_angle(
+                struct_1, struct_2, tol=conf.mutual_view_agl_tolerance)
+        mat_turn_mutual = geom.get_rotation_matrix(
+            mutual_view_agl, np.array([1., 0., 0.]))
+        # Find coincident points.
+        if conf.coincidence_engine == 'grid':
             coincident_pts = coin_srch.find_coincidence_points(
                 struct_1.coordinates, struct_2.coordinates,
-                conf.coincident_pts_search_step, conf.coincident_pts_tolerance)
-            lattice = coin_srch.find_overlattice(
-                coincident_pts, conf.lattice_vec_agl_range[0], 
-                conf.lattice_vec_agl_range[1], min_vol, max_vol, 
-                max_pts=conf.max_coincident_pts_searched, 
-                min_vec_len=conf.min_vec_length)
-
-            count = 0
-            # Generate for each qualified lattice vector set.
-            for box in lattice:
-                print('Current lattice vector set:')
-                print(box)
-                print('Expected atom count: %d' %
-                      abs(int(np.linalg.det(box) * atom_count_unit_vol) * 2))
-
-                count += 1
-                s_1_cpy = copy.deepcopy(struct_1)
-                s_2_cpy = copy.deepcopy(struct_2)
+                conf.coincident_pts_search_step,
+                conf.coincident_pts_tolerance,
+                signed=conf.coincident_pts_signed_search,
+                memory_budget=conf.coincident_pts_memory_budget * 2 ** 20)
+        elif conf.coincidence_engine == 'csl':
+            coincident_pts = coin_srch.find_csl_points(
+                struct_1.coordinates, struct_2.coordinates,
+                conf.coincident_pts_search_step,
+                tol=conf.csl_tolerance,
+                max_denominator=conf.csl_max_denominator,
+                memory_budget=conf.coincident_pts_memory_budget * 2 ** 20)
+        else:
+            raise ValueError('Coincidence engine %s not found.' %
+                             conf.coincidence_engine)
+        # Lattice vector sets are generated lazily from the smallest
+        # volume, so that the search stops once enough structures exist.
+        lattice = coin_srch.iter_overlattice(
+            coincident_pts, conf.lattice_vec_agl_range[0], 
+            conf.lattice_vec_agl_range[1], min_vol, max_vol, 
+            max_pts=conf.max_coincident_pts_searched, 
+            min_vec_len=conf.min_vec_length,
+            gauss_reduced=conf.gauss_reduced_pairs,
+            primitive_only=conf.primitive_coincident_pts)
+        if conf.unique_lattices:
+            lattice = coin_srch.unique_lattices(lattice,
+                                                struct_1.coordinates)
 
-                try:
-                    # Grow to super-cell.
-                    s_1_cpy.grow_to_supercell(box,
-                                              conf.atom_count_range[1] * 0.6)
-                    s_2_cpy.grow_to_supercell(box,
-                                              conf.atom_count_range[1] * 0.6)
-                    # Combine two structures.
-                    combined_struct = Structure.combine_structures(
-                        s_1_cpy, s_2_cpy)
-
-                    # Sanity check: whether the actual atom count matches with
-                    # expected atom count.
-                    if len(combined_struct.direct) < np.linalg.det(
-                            combined_struct.coordinates) * \
-                            atom_count_unit_vol * 0.80:
-                        print('Expected atom count not met.')
-                        count -= 1
-                        continue
-
-                    if not conf.skip_collision_removal:
-                        # Collision removal routine.
-                        coll_rmvl.remove_collision(
-                            combined_struct, conf.boundary_radius, 
-                            conf.min_atom_dist, fast=conf.fast_removal,
-                            random_delete=conf.random_delete_atom)
-
-                    # Turn the combined structure according to mutual viewing
-                    # angle.
-                    combined_struct.transform(mat_turn_mutual)
-                    # Update names and output.
-                    file_name, struct_name = generate_name(
-                        conf, orien_1, orien_2, twist_agl, 
-                        tilt, const_view_agl, tilt_agl, count)
-                    combined_struct.comment = struct_name
-                    combined_struct.to_file(
-                        file_name, conf.output_format,
-                        overwrite_protect=conf.overwrite_protect,
-                        **conf.output_options)
-
-                    if count >= conf.output_max_count:
-                        break
-                except Exception, e:
-                    traceback.print_tb(sys.exc_info()[2])
-                    print(str(e))
+        count = 0
+        # Generate for each qualified lattice vector set, in order.
+        for (status, result) in box_outcomes(
+                conf, lattice, struct_1, struct_2, mat_turn_mutual,
+                atom_count_unit_vol, backend, box_pool):
+            count += 1
+            if status == 'short':
+                print('Expected atom count not met.')
+                count -= 1
+                continue
+            elif status == 'error':
+                errors.append('Lattice vector set %d: %s' % (count, result))
+                continue
+
+            try:
+                # Update names and output.
+                file_name, struct_name = generate_name(
+                    conf, orien_1, orien_2, twist_agl, 
+                    tilt, const_view_agl, tilt_agl, count)
+                result.comment = struct_name
+                if writer is not None:
+                    writer.submit(functools.partial(
+                        write_structure, conf, result, file_name, archive),
+                        errors, 'Lattice vector set %d' % count)
                 else:
-                    pass
-        except Exception, e:
-            traceback.print_tb(sys.exc_info()[2])
-            print(str(e))
-        else:
-            pass
+                    write_structure(conf, result, file_name, archive)
+            except Exception:
+                errors.append('Lattice vector set %d: %s' %
+                              (count, traceback.format_exc()))
+
+            if count >= conf.output_max_count:
+                break
+    except Exception:
+        errors.append(traceback.format_exc())
+    return errors
+
+
+class BoxPool(object):
+    """A pool of worker processes that build the structures of lattice 
+        vector sets, with a shared counter to cancel tasks. Structures are
+        passed to and from the workers through shared files.
+
+    Attributes:
+        cancelled (multiprocessing.Value): Tasks with a token up to its value
+            are cancelled.
+        directory (str): Directory for the files of shared structures.
+        pool (multiprocessing.Pool): The worker processes.
+        processes (int): Number of worker processes.
+    """
+
+    def __init__(self, conf, processes):
+        """Starts the worker processes.
+
+        Args:
+            conf (Configuration object): Contains specifications of the run.
+            processes (int): Number of worker processes.
+        """
+        self.cancelled = multiprocessing.Value('i', -1)
+        self.directory = transport.make_directory()
+        self.pool = multiprocessing.Pool(
+            processes, initializer=init_worker,
+            initargs=(conf, self.directory, self.cancelled))
+        self.processes = processes
+        self.last_token = -1
+
+    def new_token(self):
+        """Gives a token for a new batch of tasks.
+
+        Returns:
+            int: The token, larger than all earlier ones.
+        """
+        self.last_token += 1
+        return self.last_token
+
+    def cancel(self, token):
+        """Cancels all tasks with a token up to the given one.
+
+        Args:
+            token (int): The token.
+
+        Returns:
+            (void): Does not return.
+        """
+        self.cancelled.value = token
+
+    def close(self):
+        """Waits for the workers to finish, stops them and removes the shared
+            files.
+
+        Returns:
+            (void): Does not return.
+        """
+        self.pool.close()
+        self.pool.join()
+        transport.remove_directory(self.directory)
+
+
+def build_box_structure(conf, struct_1, struct_2, box, mat_turn_mutual,
+                        atom_count_unit_vol, backend, token=None):
+    """Builds the combined structure of one lattice vector set.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+        struct_1 (Structure obj): The first structure, transformed.
+        struct_2 (Structure obj): The second structure, transformed.
+        box (nparray): The lattice vector set (3 * 3).
+        mat_turn_mutual (nparray): Matrix turning the mutual viewing angle 
+            into [1, 0, 0] (3 * 3).
+        atom_count_unit_vol (float): Expected number of atoms per unit 
+            volume.
+        backend (str): Kernel backend, as given by kernels.select_backend().
+        token (int, optional): In a worker process, the token of the task; 
+            the build stops early once the token is cancelled.
+
+    Returns:
+        (str, Structure obj): 'ok' and the combined structure, 'short' and 
+            None when the expected atom count is not met, or 'cancelled' 
+            and None.
+    """
+    # Grow to super-cell.
+    grown_1 = struct_1.grow_to_supercell(
+        box, conf.atom_count_range[1] * 0.6,
+        tiling=conf.supercell_tiling, backend=backend)
+    grown_2 = struct_2.grow_to_supercell(
+        box, conf.atom_count_range[1] * 0.6,
+        tiling=conf.supercell_tiling, backend=backend)
+    # Combine two structures.
+    combined_struct = Structure.combine_structures(grown_1, grown_2)
+    del grown_1, grown_2
+
+    # Sanity check: whether the actual atom count matches with expected 
+    # atom count.
+    if len(combined_struct.direct_pos) < np.linalg.det(
+            combined_struct.coordinates) * atom_count_unit_vol * 0.80:
+        return ('short', None)
+    if is_cancelled(token):
+        return ('cancelled', None)
+
+    if not conf.skip_collision_removal:
+        # Collision removal routine.
+        coll_rmvl.remove_collision(
+            combined_struct, conf.boundary_radius, 
+            conf.min_atom_dist, fast=conf.fast_removal,
+            random_delete=conf.random_delete_atom,
+            strategy=conf.removal_strategy, backend=backend)
+
+    # Turn the combined structure according to mutual viewing angle.
+    return ('ok', combined_struct.transform(mat_turn_mutual))
+
+
+def run_box_in_worker(token, handle_1, handle_2, *args):
+    """Builds the combined structure of one lattice vector set in a worker 
+        process.
+
+    Args:
+        token (int): Token of the task, see is_cancelled().
+        handle_1 (StructureHandle obj): Handle to the first structure.
+        handle_2 (StructureHandle obj): Handle to the second structure.
+        *args: Arguments of build_box_structure() after the structures.
+
+    Returns:
+        (str, mixed): The result of build_box_structure() with a handle to 
+            the combined structure, ('error', traceback) when it fails, or 
+            ('cancelled', None).
+    """
+    if is_cancelled(token):
+        return ('cancelled', None)
+    try:
+        # The structures stay mapped for all the tasks of a token.
+        if WORKER_STATE.get('inputs', (None,))[0] != token:
+            WORKER_STATE['inputs'] = (
+                token, transport.attach_structure(handle_1),
+                transport.attach_structure(handle_2))
+        (_, struct_1, struct_2) = WORKER_STATE['inputs']
+        (status, result) = build_box_structure(
+            WORKER_STATE['conf'], struct_1, struct_2, *args, token=token)
+        if status == 'ok':
+            result = transport.share_structure(result,
+                                               WORKER_STATE['directory'])
+        return (status, result)
+    except Exception:
+        return ('error', traceback.format_exc())
+
+
+def is_cancelled(token):
+    """Checks in a worker process whether a task has been cancelled.
+
+    Args:
+        token (int): Token of the task. Tasks with a token up to the value 
+            of the shared cancel counter are cancelled.
+
+    Returns:
+        bool: True if the task is cancelled.
+    """
+    cancelled = WORKER_STATE.get('cancelled')
+    return (token is not None and cancelled is not None and
+            token <= cancelled.value)
+
+
+def box_outcomes(conf, lattice, struct_1, struct_2, mat_turn_mutual,
+                 atom_count_unit_vol, backend, box_pool=None):
+    """Builds the combined structures of lattice vector sets, in order.
+
+    Without a pool, each set is built when the next outcome is requested. 
+    With a pool, sets are handed to the workers as the lattice search yields
+    them, keeping up to twice as many in flight as there are workers; the 
+    structures go to and come back from the workers through shared files. 
+    When the caller stops early, the work still in flight is cancelled.
+
+    Args:
+        conf (Configuration object): Contains specifications of the run.
+        lattice (iterable): The lattice vector sets (3 * 3 each).
+        struct_1 (Structure obj): The first structure, transformed.
+        struct_2 (Structure obj): The second structure, transformed.
+        mat_turn_mutual (nparray): Matrix turning the mutual viewing angle 
+            into [1, 0, 0] (3 * 3).
+        atom_count_unit_vol (float): Expected number of atoms per unit 
+            volume.
+        backend (str): Kernel backend, as given by kernels.select_backend().
+        box_pool (BoxPool obj, optional): Pool of workers to build the 
+            structures in.
+
+    Yields:
+        (str, mixed): 'ok' and the combined structure, 'short' and None when
+            the expected atom count is not met, or 'error' and a traceback.
+    """
+    if box_pool is not None:
+        token = box_pool.new_token()
+        handles = (transport.share_structure(struct_1, box_pool.directory),
+                   transport.share_structure(struct_2, box_pool.directory))
+    pending = collections.deque()
+    try:
+        for box in lattice:
+            print('Current lattice vector set:')
+            print(box)
+            print('Expected atom count: %d' %
+                  abs(int(np.linalg.det(box) * atom_count_unit_vol) * 2))
+            box_args = (struct_1, struct_2, box, mat_turn_mutual,
+                        atom_count_unit_vol, backend)
+            if box_pool is None:
+                try:
+                    yield build_box_structure(conf, *box_args)
+                except Exception:
+                    yield ('error', traceback.format_exc())
+                continue
+            pending.append(box_pool.pool.apply_async(
+                run_box_in_worker, (token,) + handles + box_args[2:]))
+            if len(pending) >= 2 * box_pool.processes:
+                yield collect_box_outcome(pending.popleft())
+        while len(pending) > 0:
+            yield collect_box_outcome(pending.popleft())
+    finally:
+        if len(pending) > 0:
+            # Stopped early: cancel the rest and drop what they shared.
+            box_pool.cancel(token)
+            for result in pending:
+                collect_box_outcome(result)
+        if box_pool is not None:
+            for handle in handles:
+                transport.remove_structure(handle)
+
+
+def collect_box_outcome(result):
+    """Waits for a lattice vector set built in a worker process.
+
+    Args:
+        result (multiprocessing.pool.AsyncResult): The pending outcome of 
+            run_box_in_worker().
+
+    Returns:
+        (str, mixed): The outcome, with the handle to a combined structure 
+            replaced by the structure.
+    """
+    (status, result) = result.get()
+    if status == 'ok':
+        result = transport.attach_structure(result, remove=True)
+    return (status, result)
 
 
 def generate_name(conf, orien_1, orien_2, twist_agl, tilt, const_view_agl, 
@@ -191,35 +625,58 @@ def generate_name(conf, orien_1, orien_2, twist_agl, tilt, const_view_agl,
     return file_name, struct_name
 
 
+def run_file(path, jobs=None):
+    """Runs genie on a configuration file.
+
+    Args:
+        path (str): Path to the .json configuration file.
+        jobs (int, optional): When given, overrides the parallelism of the 
+            configuration.
+
+    Returns:
+        (int, str) list: The errors returned by genie().
+    """
+    conf = Configuration.from_json_file(path)
+    if jobs is not None:
+        conf.parallelism = jobs
+    return genie(conf)
+
+
 def main(argv):
     """The main function that will be called from command line.
 
     Args:
         argv (str list): A list of string arguments taken from command line. 
             Can have zero extra arguments or one (specifying a file path or a 
-            directory).
+            directory), optionally with "--jobs N" to set the number of 
+            processes.
 
     Returns:
         (void): Does not return.
     """
+    jobs = None
+    if '--jobs' in argv:
+        i = argv.index('--jobs')
+        jobs = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
     if len(argv) < 2:
         # In this case, find all .json files in the current directory.
         for conf_file in [f for f in os.listdir('.') if f.endswith('.json')]:
             try:
-                genie(Configuration.from_json_file(conf_file))
+                run_file(conf_file, jobs)
             except Exception, e:
                 print(str(e))
             else:
                 pass
     elif os.path.isfile(argv[1]):
         # In this case, read in the file and run genie.
-        genie(Configuration.from_json_file(argv[1]))
+        run_file(argv[1], jobs)
     elif os.path.isdir(argv[1]):
         # In this case, find all .json files in the given directory.
         for conf_file in [f for f in os.listdir(argv[1]) if
                           f.endswith('.json')]:
             try:
-                genie(Configuration.from_json_file(conf_file))
+                run_file(conf_file, jobs)
             except Exception, e:
                 traceback.print_tb(sys.exc_info()[2])
                 print(str(e))
@@ -154,6 +154,318 @@ def get_box_angles(lat_vecs):
         vector_angle_to_plane(lat_vecs[2], lat_vecs[0], lat_vecs[1])
     ])
 
+def get_boxes_angles(boxes):
+    """Vectorized get_box_angles over many lattice vector sets.
+
+    The angle between a vector and the plane of the other two is the arcsine
+    of the box volume over the vector length times the area spanned by the
+    other two.
+
+    Args:
+        boxes (nparray): Lattice vector sets (n * 3 * 3).
+
+    Returns:
+        nparray: Angles of each vector to the plane of the other two, in rad
+            (n * 3). Degenerate sets give NaN.
+    """
+    vols = np.absolute(np.einsum('ij,ij->i', boxes[:, 0],
+                                 np.cross(boxes[:, 1], boxes[:, 2])))
+    lengths = np.linalg.norm(boxes, axis=2)
+    areas = np.column_stack((
+        np.linalg.norm(np.cross(boxes[:, 1], boxes[:, 2]), axis=1),
+        np.linalg.norm(np.cross(boxes[:, 2], boxes[:, 0]), axis=1),
+        np.linalg.norm(np.cross(boxes[:, 0], boxes[:, 1]), axis=1)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.arcsin(np.minimum(vols[:, np.newaxis] / (lengths * areas),
+                                    1.0))
+
+
 def box_good_c(box, epsilon=1e-3):
     normed_vec = normalize_vector(box[2])
-    return abs(normed_vec[0]) <= epsilon and abs(normed_vec[1]) <= epsilon
\ No newline at end of file
+    return abs(normed_vec[0]) <= epsilon and abs(normed_vec[1]) <= epsilon
+
+
+def parallel_to_z(vecs, epsilon=1e-3):
+    """Vectorized test of whether vectors are parallel to (0, 0, 1), as in 
+        box_good_c.
+
+    Args:
+        vecs (nparray): Vectors (n * 3).
+        epsilon (float, optional): Largest x and y component allowed in the
+            normalized vector.
+
+    Returns:
+        nparray: Boolean array (n), True for vectors parallel to the z axis.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normed_vecs = vecs / np.linalg.norm(vecs, axis=1)[:, np.newaxis]
+    return np.all(np.absolute(normed_vecs[:, 0:2]) <= epsilon, axis=1)
+
+def smith_normal_form(mat):
+    """Finds the Smith normal form of an integer matrix.
+
+    Args:
+        mat (nparray): An integer matrix (n * m).
+
+    Returns:
+        nparray, nparray, nparray: The diagonal matrix d (n * m) and the 
+            unimodular matrices u (n * n) and v (m * m) such that 
+            u * mat * v = d, with each diagonal entry of d non-negative and 
+            dividing the next one.
+    """
+    # Python integers are used so that intermediate values cannot overflow.
+    a = [[int(x) for x in row] for row in np.array(mat).tolist()]
+    n, m = len(a), len(a[0])
+    u = [[int(i == j) for j in range(n)] for i in range(n)]
+    v = [[int(i == j) for j in range(m)] for i in range(m)]
+
+    def add_row(dst, src, mult):
+        for mtx in (a, u):
+            mtx[dst] = [x + mult * y for (x, y) in zip(mtx[dst], mtx[src])]
+
+    def add_col(dst, src, mult):
+        for mtx in (a, v):
+            for row in mtx:
+                row[dst] += mult * row[src]
+
+    for t in range(min(n, m)):
+        while True:
+            pivots = [(abs(a[i][j]), i, j) for i in range(t, n)
+                      for j in range(t, m) if a[i][j] != 0]
+            if len(pivots) <= 0:
+                return np.array(a), np.array(u), np.array(v)
+            # Move the smallest non-zero entry to the pivot position.
+            _, pi, pj = min(pivots)
+            a[t], a[pi] = a[pi], a[t]
+            u[t], u[pi] = u[pi], u[t]
+            for mtx in (a, v):
+                for row in mtx:
+                    row[t], row[pj] = row[pj], row[t]
+            # Reduce the pivot row and column; repeat if remainders are left.
+            done = True
+            for i in range(t + 1, n):
+                add_row(i, t, -(a[i][t] // a[t][t]))
+                done = done and a[i][t] == 0
+            for j in range(t + 1, m):
+                add_col(j, t, -(a[t][j] // a[t][t]))
+                done = done and a[t][j] == 0
+            if not done:
+                continue
+            # The pivot must divide every entry of the remaining block.
+            bad_rows = [i for i in range(t + 1, n) for j in range(t + 1, m)
+                        if a[i][j] % a[t][t] != 0]
+            if len(bad_rows) <= 0:
+                break
+            add_row(t, bad_rows[0], 1)
+        if a[t][t] < 0:
+            a[t] = [-x for x in a[t]]
+            u[t] = [-x for x in u[t]]
+    return np.array(a), np.array(u), np.array(v)
+
+
+def hermite_normal_form(mat):
+    """Finds the row-style Hermite normal form of an integer matrix, which is
+        the same for all matrices whose rows span the same lattice.
+
+    Args:
+        mat (nparray): An integer matrix (n * m).
+
+    Returns:
+        nparray: The upper triangular matrix h (n * m) such that h = u * mat
+            for a unimodular u, with positive pivots and the entries above 
+            each pivot in range [0, pivot).
+    """
+    # Python integers are used so that intermediate values cannot overflow.
+    a = [[int(x) for x in row] for row in np.array(mat).tolist()]
+    n, m = len(a), len(a[0])
+    row = 0
+    for col in range(m):
+        if row >= n:
+            break
+        # Euclid's algorithm on the column, below the current row.
+        while True:
+            nonzero = [i for i in range(row, n) if a[i][col] != 0]
+            if len(nonzero) <= 0:
+                break
+            pivot = min(nonzero, key=lambda i: abs(a[i][col]))
+            a[row], a[pivot] = a[pivot], a[row]
+            done = True
+            for i in range(row + 1, n):
+                mult = a[i][col] // a[row][col]
+                a[i] = [x - mult * y for (x, y) in zip(a[i], a[row])]
+                done = done and a[i][col] == 0
+            if done:
+                break
+        if a[row][col] == 0:
+            continue
+        if a[row][col] < 0:
+            a[row] = [-x for x in a[row]]
+        for i in range(row):
+            mult = a[i][col] // a[row][col]
+            a[i] = [x - mult * y for (x, y) in zip(a[i], a[row])]
+        row += 1
+    return np.array(a)
+
+
+def lll_reduce(basis, delta=0.75):
+    """Reduces a lattice basis with the Lenstra-Lenstra-Lovasz algorithm.
+
+    Args:
+        basis (nparray): Lattice vectors, one on each row (n * m).
+        delta (float, optional): The Lovasz parameter, between 0.25 and 1.
+
+    Returns:
+        nparray, nparray: The reduced basis (n * m) and the unimodular integer
+            matrix t (n * n) such that t * basis equals the reduced basis.
+    """
+    b = np.array(basis, dtype=float)
+    n = len(b)
+    t = np.identity(n, dtype=int)
+
+    def gram_schmidt(b):
+        ortho = np.zeros(b.shape)
+        mu = np.zeros((n, n))
+        for i in range(n):
+            ortho[i] = b[i]
+            for j in range(i):
+                mu[i, j] = np.dot(b[i], ortho[j]) / np.dot(ortho[j], ortho[j])
+                ortho[i] -= mu[i, j] * ortho[j]
+        return ortho, mu
+
+    ortho, mu = gram_schmidt(b)
+    k = 1
+    while k < n:
+        for j in range(k - 1, -1, -1):
+            q = int(np.rint(mu[k, j]))
+            if q != 0:
+                b[k] -= q * b[j]
+                t[k] -= q * t[j]
+                ortho, mu = gram_schmidt(b)
+        if np.dot(ortho[k], ortho[k]) >= (delta - mu[k, k - 1] ** 2) * \
+                np.dot(ortho[k - 1], ortho[k - 1]):
+            k += 1
+        else:
+            b[[k - 1, k]] = b[[k, k - 1]]
+            t[[k - 1, k]] = t[[k, k - 1]]
+            ortho, mu = gram_schmidt(b)
+            k = max(k - 1, 1)
+    return b, t
+
+
+def gauss_reduced(vecs_1, vecs_2, tol=1e-9):
+    """Vectorized test of whether pairs of 2-D vectors are Gauss-reduced, 
+        i.e. neither vector can be shortened by adding a multiple of the 
+        other.
+
+    Args:
+        vecs_1 (nparray): First vectors of the pairs (n * 2).
+        vecs_2 (nparray): Second vectors of the pairs (n * 2).
+        tol (float, optional): Relative tolerance of the comparison.
+
+    Returns:
+        nparray: Boolean array (n), True for Gauss-reduced pairs.
+    """
+    dots = np.absolute(np.einsum('ij,ij->i', vecs_1, vecs_2))
+    shorter = np.minimum(np.einsum('ij,ij->i', vecs_1, vecs_1),
+                         np.einsum('ij,ij->i', vecs_2, vecs_2))
+    return dots <= 0.5 * shorter * (1.0 + tol)
+
+def periodic_neighbor_pairs(direct_pos, lattice_vecs, cutoff):
+    """Finds pairs of atoms that may lie within a cutoff distance of each 
+        other in a periodic cell, using a cell list in direct coordinates.
+
+    The cell is divided into bins at least cutoff wide perpendicular to each
+    face, so every pair closer than cutoff across any periodic image falls 
+    in the same or adjacent bins. The pairs returned are a superset of the 
+    close pairs; distances are left to the caller.
+
+    Args:
+        direct_pos (nparray): Atom positions in direct coordinates (n * 3).
+        lattice_vecs (nparray): Lattice vectors, one on each row (3 * 3).
+        cutoff (float): The cutoff distance in angstrom, must be positive.
+
+    Returns:
+        (nparray, nparray): Indices of the first and second atoms of each 
+            pair (m each); every unordered pair of distinct atoms appears 
+            once.
+    """
+    # Perpendicular width of the cell along each lattice vector.
+    widths = 1. / np.linalg.norm(np.linalg.inv(lattice_vecs), axis=0)
+    bin_counts = np.maximum(np.floor(widths / cutoff), 1).astype(int)
+    bins = np.floor((direct_pos % 1.) * bin_counts).astype(int)
+    bins = np.minimum(bins, bin_counts - 1)
+    bin_ids = np.ravel_multi_index(bins.T, bin_counts)
+    atom_idx = np.argsort(bin_ids, kind='mergesort')
+    bin_starts = np.searchsorted(bin_ids[atom_idx],
+                                 np.arange(np.prod(bin_counts)))
+    bin_sizes = np.diff(np.append(bin_starts, len(direct_pos)))
+    # Neighboring bin offsets along each axis, without repeats when there 
+    # are fewer than three bins.
+    offsets = [np.unique(np.array([-1, 0, 1]) % n) for n in bin_counts]
+    firsts = []
+    seconds = []
+    for offset in np.stack(np.meshgrid(*offsets, indexing='ij'),
+                           axis=-1).reshape(-1, 3):
+        targets = np.ravel_multi_index(((bins + offset) % bin_counts).T,
+                                       bin_counts)
+        first, second = expand_ranges(bin_starts[targets],
+                                      bin_sizes[targets])
+        second = atom_idx[second]
+        # Each unordered pair shows up in both directions; keep one.
+        keep = first < second
+        firsts.append(first[keep])
+        seconds.append(second[keep])
+    return (np.concatenate(firsts), np.concatenate(seconds))
+
+
+def expand_ranges(starts, sizes):
+    """Expands one range of indices per item into flat index pairs.
+
+    Args:
+        starts (nparray): First index of the range of each item (n).
+        sizes (nparray): Length of the range of each item (n).
+
+    Returns:
+        (nparray, nparray): For every index in every range, the item it 
+            belongs to and the index itself (sum(sizes) each).
+    """
+    items = np.repeat(np.arange(len(starts)), sizes)
+    offsets = np.arange(len(items)) - np.repeat(np.cumsum(sizes) - sizes,
+                                                sizes)
+    return (items, np.repeat(starts, sizes) + offsets)
+
+
+def neighbor_pairs(pos_1, pos_2, cutoff):
+    """Finds pairs of points from two sets that may lie within a cutoff 
+        distance of each other, by hashing the points into cubic buckets.
+
+    Args:
+        pos_1 (nparray): Cartesian positions of a set of points (n * 3).
+        pos_2 (nparray): Cartesian positions of another set of points 
+            (m * 3).
+        cutoff (float): The cutoff distance, must be positive.
+
+    Returns:
+        (nparray, nparray): Indices into pos_1 and pos_2 of each pair; the 
+            pairs are a superset of those closer than cutoff.
+    """
+    if len(pos_1) <= 0 or len(pos_2) <= 0:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    cells_1 = np.floor(pos_1 / cutoff).astype(np.int64)
+    cells_2 = np.floor(pos_2 / cutoff).astype(np.int64)
+    # Pad by one bucket so that neighbors of pos_1 are in range as well.
+    low = np.minimum(cells_1.min(axis=0), cells_2.min(axis=0)) - 1
+    dims = np.maximum(cells_1.max(axis=0), cells_2.max(axis=0)) - low + 2
+    keys_2 = np.ravel_multi_index((cells_2 - low).T, dims)
+    idx_2 = np.argsort(keys_2, kind='mergesort')
+    keys_2 = keys_2[idx_2]
+    firsts = []
+    seconds = []
+    for offset in cartesian_product(np.array([-1, 0, 1]), 3):
+        keys_1 = np.ravel_multi_index((cells_1 + offset - low).T, dims)
+        starts = np.searchsorted(keys_2, keys_1, side='left')
+        sizes = np.searchsorted(keys_2, keys_1, side='right') - starts
+        first, second = expand_ranges(starts, sizes)
+        firsts.append(first)
+        seconds.append(idx_2[second])
+    return (np.concatenate(firsts), np.concatenate(seconds))
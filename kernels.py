@@ -0,0 +1,135 @@
+"""Loop kernels for the sequential hot spots of collision removal and super-
+cell tiling.
+
+The kernels are written as plain loops over NumPy arrays. Selecting the 
+'numba' backend with select_backend() compiles them with Numba, which is only
+imported then; callers use the kernels for the 'numba' backend and their own
+vectorized NumPy code for the 'numpy' backend. Both backends give identical 
+results.
+
+Attributes:
+    BACKENDS (str list): Names of the supported backends.
+"""
+
+BACKENDS = ['numpy', 'numba']
+
+
+def select_backend(backend):
+    """Checks the name of a backend, falling back to NumPy when Numba is
+        requested but not installed.
+
+    Args:
+        backend (str): Either 'numpy' or 'numba'.
+
+    Returns:
+        str: The backend to use.
+
+    Raises:
+        ValueError: Raised when the backend is not known.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Backend %s not found.' % backend)
+    if backend == 'numba' and not compile_kernels():
+        print('Numba not found, falling back to NumPy backend.')
+        return 'numpy'
+    return backend
+
+
+def compile_kernels():
+    """Replaces the kernels of this module by their Numba-compiled versions,
+        unless that has been done already.
+
+    Returns:
+        bool: True when the kernels are compiled, False when Numba is not 
+            installed.
+    """
+    global keep_first_loop, count_inside_loop, fill_inside_loop
+    try:
+        import numba
+    except ImportError:
+        return False
+    if not hasattr(keep_first_loop, 'py_func'):
+        keep_first_loop = numba.njit(keep_first_loop)
+        count_inside_loop = numba.njit(count_inside_loop)
+        fill_inside_loop = numba.njit(fill_inside_loop)
+    return True
+
+
+def keep_first_loop(starts, earlier, keep):
+    """Resolves collisions greedily in order: an atom is kept unless it
+        collides with an earlier atom that is kept.
+
+    Args:
+        starts (nparray): For each atom, where its earlier colliding atoms
+            start in earlier; the last entry is len(earlier) (n + 1).
+        earlier (nparray): Earlier colliding atoms, grouped by the later
+            atom of each pair (m).
+        keep (nparray): Boolean output array (n).
+
+    Returns:
+        nparray: keep, True for atoms that are kept.
+    """
+    for i in range(len(keep)):
+        keep[i] = True
+        for k in range(starts[i], starts[i + 1]):
+            if keep[earlier[k]]:
+                keep[i] = False
+                break
+    return keep
+
+
+def count_inside_loop(base, shifts, tol):
+    """Counts the image atoms inside the unit box.
+
+    Args:
+        base (nparray): Direct positions of the atoms in the original cell
+            (n * 3).
+        shifts (nparray): Direct shift of each image cell (m * 3).
+        tol (float): Tolerance on the faces of the box.
+
+    Returns:
+        int: Number of image atoms inside the box.
+    """
+    count = 0
+    for m in range(shifts.shape[0]):
+        for a in range(base.shape[0]):
+            inside = True
+            for k in range(3):
+                if abs(base[a, k] + shifts[m, k] - 0.5) >= 0.5 + tol:
+                    inside = False
+                    break
+            if inside:
+                count += 1
+    return count
+
+
+def fill_inside_loop(base, shifts, tol, out_pos, out_atom):
+    """Writes the image atoms inside the unit box, by image then by atom.
+
+    Args:
+        base (nparray): Direct positions of the atoms in the original cell
+            (n * 3).
+        shifts (nparray): Direct shift of each image cell (m * 3).
+        tol (float): Tolerance on the faces of the box.
+        out_pos (nparray): Output positions, sized by count_inside_loop()
+            (c * 3).
+        out_atom (nparray): Output index of the original atom of each image
+            atom (c).
+
+    Returns:
+        int: Number of image atoms written.
+    """
+    count = 0
+    for m in range(shifts.shape[0]):
+        for a in range(base.shape[0]):
+            inside = True
+            for k in range(3):
+                if abs(base[a, k] + shifts[m, k] - 0.5) >= 0.5 + tol:
+                    inside = False
+                    break
+            if inside:
+                for k in range(3):
+                    out_pos[count, k] = base[a, k] + shifts[m, k]
+                out_atom[count] = a
+                count += 1
+    return count
@@ -1,31 +1,139 @@
 """Structure provides a paradigm to represent a crystal structure.
+
+Attributes:
+    ELEMENT_SYMBOLS (str list): Element symbols shared by all Structure 
+        objects. Atoms store the index of their symbol in this list, the 
+        element code. Known elements have their atomic number as code; other
+        symbols are appended when first seen.
 """
 import sys
 import copy
+import itertools
 import numpy as np
 import utilities as util
 import geometry as geom
+import kernels
 from constants import PERIODIC_TABLE
 from math import pi as PI
 
 
+ELEMENT_SYMBOLS = [''] + sorted(PERIODIC_TABLE.keys(),
+                                key=lambda x: PERIODIC_TABLE[x])
+ELEMENT_CODE_TYPE = np.int16
+ATOM_RECORD_TYPE = [('position', float, 3), ('element', '|S5')]
+
+
+def element_codes(symbols):
+    """Converts element symbols into element codes.
+
+    Args:
+        symbols (str list): Element symbols (n).
+
+    Returns:
+        nparray: Element codes (n).
+    """
+    uniq_symbols, inverse = np.unique(np.asarray(symbols, dtype='|S5'),
+                                      return_inverse=True)
+    lookup = []
+    for sym in uniq_symbols.tolist():
+        if sym not in ELEMENT_SYMBOLS:
+            ELEMENT_SYMBOLS.append(sym)
+        lookup.append(ELEMENT_SYMBOLS.index(sym))
+    return np.array(lookup, dtype=ELEMENT_CODE_TYPE)[inverse]
+
+
+def element_symbols(codes):
+    """Converts element codes into element symbols.
+
+    Args:
+        codes (nparray): Element codes (n).
+
+    Returns:
+        nparray: Element symbols (n).
+    """
+    return np.array(ELEMENT_SYMBOLS, dtype='|S5')[codes]
+
+
+def atom_order(positions, codes):
+    """Finds the order that sorts atoms by element symbol, then by position.
+
+    Args:
+        positions (nparray): Atom positions (n * 3).
+        codes (nparray): Element codes (n).
+
+    Returns:
+        nparray: Indices that sort the atoms (n).
+    """
+    symbol_rank = np.argsort(np.argsort(ELEMENT_SYMBOLS, kind='mergesort'))
+    return np.lexsort((positions[:, 2], positions[:, 1], positions[:, 0],
+                       symbol_rank[codes]))
+
+
+def read_only(array):
+    """Gives a view of an array that cannot be changed in place.
+
+    Args:
+        array (nparray): Any array.
+
+    Returns:
+        nparray: A read-only view of array.
+    """
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+
+def atom_records(positions, codes):
+    """Packs atom positions and element codes into a record array.
+
+    Args:
+        positions (nparray): Atom positions (n * 3).
+        codes (nparray): Element codes (n).
+
+    Returns:
+        nparray: A record type nparray with fields 'position' and 'element'.
+    """
+    atoms = np.empty(len(positions), dtype=ATOM_RECORD_TYPE)
+    atoms['position'] = positions
+    atoms['element'] = element_symbols(codes)
+    return atoms
+
+
 class Structure(object):
     """A class representing a crystal structure.
 
+    Atoms are stored as contiguous arrays of positions and element codes; 
+    the record arrays direct and cartesian are kept for compatibility and 
+    are built on access. Only one of the direct and Cartesian positions is 
+    kept up to date when atoms change; the other is recalculated the next 
+    time it is accessed.
+
+    The arrays of a Structure are read-only and are replaced rather than 
+    changed in place, so copies, and the structures returned by transform, 
+    grow_to_supercell and combine_structures, share every array they do not
+    change.
+
     Attributes:
-        cartesian (nparray): An array of no record nparray, representing the 
-            atoms in the Cartesian coordinates.
+        cartesian (nparray): A record array of the atoms in the Cartesian 
+            coordinates, with fields 'position' and 'element'.
+        cartesian_pos (nparray): Atom positions in the Cartesian coordinates
+            (n * 3). Assigning it marks direct_pos as stale.
         comment (str): Description of the crystal structure.
         coordinates (nparray): A 3*3 nparray with each row representing a 
-            lattice vector.
-        direct (nparray): An array of no record nparray, representing the 
-            atoms in the direct coordinates.
+            lattice vector. Assigning it keeps the direct positions and 
+            marks cartesian_pos as stale.
+        direct (nparray): A record array of the atoms in the direct 
+            coordinates, with fields 'position' and 'element'.
+        direct_pos (nparray): Atom positions in the direct coordinates 
+            (n * 3). Assigning it marks cartesian_pos as stale.
+        element_codes (nparray): Element code of each atom, an index into 
+            ELEMENT_SYMBOLS (n).
         elements (str set): A set of all element types present in the 
             structure.    
         view_agls (nparray): An array of viewing angles (n * 3).
     """
 
-    def __init__(self, comment, scaling, coordinates, atoms, 
+    def __init__(self, comment, scaling, coordinates, positions, elements,
                  view_agl_count=10):
         """Initializes a new Structure object.
 
@@ -34,9 +142,10 @@ class Structure(object):
             scaling (float): The scaling.
             coordinates (nparray): A 3*3 nparray with each row representing a 
                 lattice vector.
-            atoms (nparray): A record type nparray with two fields: 'position' 
-                representing the positions with nparray of length 3, and 
-                'element' representing the name of the elements as string.
+            positions (nparray): Atom positions in the direct coordinates 
+                (n * 3).
+            elements (nparray): Element symbols or element codes of the 
+                atoms (n).
             view_agl_count (int, optional): Number of viewing angles searched
                 and recommended.
 
@@ -44,16 +153,96 @@ class Structure(object):
             ValueError: Raised when the input coordinate system is singular.
         """
         self.comment = '_'.join(comment.split())
-        self.coordinates = coordinates * scaling
+        self._coordinates = read_only(coordinates * scaling)
         epsilon = 5.0 * (10 ** -4)
         if (abs(np.linalg.det(self.coordinates) - 0.0) <= epsilon):
             raise ValueError('Coordinate lattice not valid: singular matrix.')
-        self.direct = atoms
-        self.cartesian = copy.deepcopy(self.direct)
-        self.cartesian['position'] = np.dot(self.cartesian['position'],
-                                            self.coordinates)
-        self.elements = set(np.unique(atoms['element']))
-        self.view_agls = self.find_viewing_angle(view_agl_count)
+        self.direct_pos = np.array(positions, dtype=float).reshape(-1, 3)
+        elements = np.asarray(elements)
+        if elements.dtype.kind in 'SU':
+            self.element_codes = element_codes(elements)
+        else:
+            self.element_codes = elements.astype(ELEMENT_CODE_TYPE)
+        self.view_agls = read_only(self.find_viewing_angle(view_agl_count))
+
+    @property
+    def coordinates(self):
+        """nparray: Lattice vectors, one on each row (3 * 3)."""
+        return self._coordinates
+
+    @coordinates.setter
+    def coordinates(self, coordinates):
+        # Atoms keep their direct positions when the lattice changes.
+        self.direct_pos = self.direct_pos
+        self._coordinates = read_only(coordinates)
+
+    @property
+    def direct_pos(self):
+        """nparray: Atom positions in the direct coordinates (n * 3)."""
+        if self._direct_pos is None:
+            self._direct_pos = read_only(np.dot(
+                self._cartesian_pos, np.linalg.inv(self.coordinates)))
+        return self._direct_pos
+
+    @direct_pos.setter
+    def direct_pos(self, positions):
+        self._direct_pos = read_only(positions)
+        self._cartesian_pos = None
+
+    @property
+    def cartesian_pos(self):
+        """nparray: Atom positions in the Cartesian coordinates (n * 3)."""
+        if self._cartesian_pos is None:
+            self._cartesian_pos = read_only(np.dot(self._direct_pos,
+                                                   self.coordinates))
+        return self._cartesian_pos
+
+    @cartesian_pos.setter
+    def cartesian_pos(self, positions):
+        self._cartesian_pos = read_only(positions)
+        self._direct_pos = None
+
+    @property
+    def element_codes(self):
+        """nparray: Element code of each atom (n)."""
+        return self._element_codes
+
+    @element_codes.setter
+    def element_codes(self, codes):
+        self._element_codes = read_only(codes)
+
+    @property
+    def elements(self):
+        """str set: Element types present in the structure."""
+        return set(element_symbols(np.unique(self.element_codes)).tolist())
+
+    @property
+    def direct(self):
+        """nparray: Record array of the atoms in the direct coordinates."""
+        return atom_records(self.direct_pos, self.element_codes)
+
+    @direct.setter
+    def direct(self, atoms):
+        self.direct_pos = np.array(atoms['position'], dtype=float)
+        self.element_codes = element_codes(atoms['element'])
+
+    @property
+    def cartesian(self):
+        """nparray: Record array of the atoms in the Cartesian coordinates."""
+        return atom_records(self.cartesian_pos, self.element_codes)
+
+    @cartesian.setter
+    def cartesian(self, atoms):
+        self.cartesian_pos = np.array(atoms['position'], dtype=float)
+        self.element_codes = element_codes(atoms['element'])
+
+    def copy(self):
+        """Makes a copy of the Structure object that shares its arrays.
+
+        Returns:
+            Structure obj: The copy.
+        """
+        return copy.copy(self)
 
     def __str__(self):
         """The to-string method.
@@ -73,19 +262,20 @@ class Structure(object):
         rows.append(['  c'] + map(lambda x: '%.5f' % x,
                                   self.coordinates[2].tolist()))
         res += util.tabulate(rows) + '\n'
+        symbols = element_symbols(self.element_codes)
         res += '*** Atoms (Direct): \n'
         rows = []
         rows.append(['  a', 'b', 'c', 'element'])
-        for ent in self.direct:
-            rows.append(['  %.5f' % ent[0][0], '%.5f' % ent[0][1],
-                         '%.5f' % ent[0][2], '%s' % ent[1]])
+        for (pos, sym) in zip(self.direct_pos, symbols):
+            rows.append(['  %.5f' % pos[0], '%.5f' % pos[1],
+                         '%.5f' % pos[2], '%s' % sym])
         res += util.tabulate(rows)
         res += '\n*** Atoms (Cartesian): \n'
         rows = []
         rows.append(['  x', 'y', 'z', 'element'])
-        for ent in self.cartesian:
-            rows.append(['  %.5f' % ent[0][0], '%.5f' % ent[0][1],
-                         '%.5f' % ent[0][2], '%s' % ent[1]])
+        for (pos, sym) in zip(self.cartesian_pos, symbols):
+            rows.append(['  %.5f' % pos[0], '%.5f' % pos[1],
+                         '%.5f' % pos[2], '%s' % sym])
         res += util.tabulate(rows)
         return res
 
@@ -98,16 +288,13 @@ class Structure(object):
         Returns:
             nparray: A list of vectors (n * 3).
         """
-        dist_to_ctr = np.apply_along_axis(
-            np.linalg.norm, 1, 
-            self.cartesian['position'] - np.dot(
-                np.array([.5, .5, .5]), 
-                self.coordinates))
-        ctr_atoms = self.cartesian[np.argsort(dist_to_ctr)]
-        agl_count = min(len(self.cartesian) - 1, view_agl_count)
-        view_agls = ctr_atoms[1:view_agl_count +
-                              1]['position'] - ctr_atoms[0]['position']
-        view_agls = np.apply_along_axis(geom.normalize_vector, 1, view_agls)
+        dist_to_ctr = np.linalg.norm(
+            self.cartesian_pos - np.dot(np.array([.5, .5, .5]),
+                                        self.coordinates), axis=1)
+        ctr_atoms = self.cartesian_pos[np.argsort(dist_to_ctr)]
+        view_agls = ctr_atoms[1:view_agl_count + 1] - ctr_atoms[0]
+        view_agls = view_agls / np.linalg.norm(view_agls,
+                                               axis=1)[:, np.newaxis]
         return view_agls
 
     @staticmethod
@@ -138,6 +325,30 @@ class Structure(object):
             res = res[np.argsort(diff)]
             return res[0]
 
+    @staticmethod
+    def from_arrays(comment, coordinates, direct_pos, codes, view_agls):
+        """Builds a Structure object around existing arrays, without checking
+            the lattice or searching for viewing angles.
+
+        Args:
+            comment (str): Description of the crystal structure.
+            coordinates (nparray): Lattice vectors, one on each row (3 * 3).
+            direct_pos (nparray): Atom positions in the direct coordinates
+                (n * 3).
+            codes (nparray): Element code of each atom (n).
+            view_agls (nparray): Viewing angles (k * 3).
+
+        Returns:
+            Structure obj: The structure, using the arrays without copying.
+        """
+        res = Structure.__new__(Structure)
+        res.comment = comment
+        res._coordinates = read_only(coordinates)
+        res.direct_pos = direct_pos
+        res.element_codes = codes
+        res.view_agls = read_only(view_agls)
+        return res
+
     @staticmethod
     def from_file(path, **kwargs):
         """A unified method to parse a file and generate Structure object.
@@ -195,6 +406,10 @@ class Structure(object):
     def from_vasp(path, **kwargs):
         """Takes a .vasp file and generate Structure object.
 
+        Positions may be in the direct or the Cartesian mode, and may carry
+        selective dynamics flags, which are ignored. The block of positions 
+        is parsed at once.
+
         Args:
             path (str): Path to the file.
             **kwargs (dict): Supports keyword 'view_agl_count' to set how many
@@ -216,42 +431,48 @@ class Structure(object):
             coordinates = np.array([map(float, in_file.readline().split()),
                                     map(float, in_file.readline().split()),
                                     map(float, in_file.readline().split())])
+            if scaling < 0.0:
+                # A negative scaling gives the volume of the cell instead.
+                scaling = (-scaling / abs(np.linalg.det(coordinates))) ** \
+                    (1.0 / 3.0)
 
-            next_line = in_file.readline().split()
+            element_list = in_file.readline().split()
             try:
-                element_count = map(int, next_line)
-            except ValueError as e:
-                element_list = next_line
-                next_line = in_file.readline().split()
-                element_count = map(int, next_line)
+                map(int, element_list)
+            except ValueError:
+                element_count = map(int, in_file.readline().split())
             else:
                 raise ValueError('Element names not provided.')
-            finally:
-                if (len(element_list) != len(element_count)):
-                    raise ValueError(
-                        'Element list and count lengths mismatch.')
-
-            elements = []
-            for (name, count) in zip(element_list, element_count):
-                elements += [name for _ in range(count)]
-            elements = np.array(elements)
-
-            next_line = in_file.readline().split()
-            if (next_line[0] == 'Selective'):
-                next_line = in_file.readline().split()
-
-            if (next_line[0] != 'Direct' and next_line[0] != 'D' and
-                next_line[0] != 'direct' and next_line[0] != 'd'):
-                raise ValueError('Only Mode "Direct" supported.')
-
-            atoms = []
-            for _ in range(0, sum(element_count)):
-                atoms.append(map(float, in_file.readline().split()[0:3]))
-            atoms = np.array(zip(atoms, elements),
-                             dtype=[('position', '>f4', 3),
-                                    ('element', '|S5')])
-
-        return Structure(comment, scaling, coordinates, atoms,
+            if (len(element_list) != len(element_count)):
+                raise ValueError('Element list and count lengths mismatch.')
+            elements = np.repeat(element_codes(element_list), element_count)
+
+            # Only the first letter of the mode lines counts.
+            mode = in_file.readline().strip()[:1]
+            if mode in ['S', 's']:
+                mode = in_file.readline().strip()[:1]
+            if mode not in ['D', 'd', 'C', 'c', 'K', 'k']:
+                raise ValueError('Mode must be either "Direct" or ' + 
+                                 '"Cartesian".')
+
+            atom_count = len(elements)
+            block = ''.join(itertools.islice(in_file, atom_count))
+            positions = np.fromstring(block, sep=' ')
+            if len(positions) != atom_count * 3:
+                # Lines carry selective dynamics flags or element names: 
+                # keep the first three columns.
+                tokens = block.split()
+                if atom_count == 0 or len(tokens) % atom_count != 0:
+                    raise ValueError('Atom positions not in accordance ' +
+                                     'with the %d atoms given.' % atom_count)
+                positions = np.array(tokens).reshape(
+                    atom_count, -1)[:, 0:3].astype(float)
+            positions = positions.reshape(atom_count, 3)
+
+        if mode not in ['D', 'd']:
+            # Cartesian positions are scaled like the lattice vectors.
+            positions = np.dot(positions, np.linalg.inv(coordinates))
+        return Structure(comment, scaling, coordinates, positions, elements,
                          view_agl_count=view_agl_count)
 
     def to_vasp(self, path, overwrite_protect):
@@ -272,29 +493,18 @@ class Structure(object):
             for vector in self.coordinates:
                 out_file.write(' '.join(map(str, vector.tolist())) + '\n')
 
-            self.direct.sort(order='element')
-            element_list = []
-            element_count = []
-            prev_element = None
-            prev_count = None
-            for ele in self.direct['element']:
-                if (ele != prev_element):
-                    if prev_element is not None:
-                        element_list.append(prev_element)
-                        element_count.append(prev_count)
-                    prev_element = ele
-                    prev_count = 1
-                else:
-                    prev_count += 1
-            element_list.append(prev_element)
-            element_count.append(prev_count)
-            out_file.write(' '.join(element_list) + '\n')
-            out_file.write(' '.join(map(str, element_count)) + '\n')
+            # Atoms are sorted by element after reconcile; find where each
+            # run of one element starts.
+            starts = np.concatenate(([0], np.flatnonzero(
+                np.diff(self.element_codes)) + 1))
+            element_list = element_symbols(self.element_codes[starts])
+            element_count = np.diff(np.append(starts, len(self.direct_pos)))
+            out_file.write(' '.join(element_list.tolist()) + '\n')
+            out_file.write(' '.join(map(str, element_count.tolist())) + '\n')
 
             out_file.write('Direct\n')
-            for pos in self.direct['position']:
-                out_file.write('%.16f  %.16f  %.16f\n' %
-                               (pos[0], pos[1], pos[2]))
+            util.write_rows(out_file, '%.16f  %.16f  %.16f\n',
+                            self.direct_pos.T)
 
         return
 
@@ -311,14 +521,18 @@ class Structure(object):
         """
         self.reconcile(according_to='D')
         out_name = path if path.split('.')[-1] == 'xyz' else path + '.xyz'
+        symbols = element_symbols(self.element_codes)
+        positions = self.cartesian_pos.T
+        # Columns are padded to their widest entry, as util.tabulate does;
+        # each row starts a new line, so the file has no final newline.
+        widths = [max([len(sym) for sym in np.unique(symbols)] + [0])] + \
+            [util.column_width(column, '%.16f') for column in positions]
+        row_format = '\n%%-%ds  %%-%d.16f  %%-%d.16f  %%-%d.16f' % \
+            tuple(widths)
         with util.open_write_file(out_name, overwrite_protect) as out_file:
-            out_file.write(str(self.cartesian.shape[0]) + '\n')
-            out_file.write(self.comment + '\n')
-            rows = []
-            for ent in self.cartesian:
-                rows.append(['%s' % ent[1], '%.16f' % ent[0][0],
-                             '%.16f' % ent[0][1], '%.16f' % ent[0][2]])
-            out_file.write(util.tabulate(rows))
+            out_file.write(str(self.cartesian_pos.shape[0]) + '\n')
+            out_file.write(self.comment)
+            util.write_rows(out_file, row_format, [symbols] + list(positions))
         return
 
     def to_ems(self, path, overwrite_protect, **kwargs):
@@ -345,53 +559,68 @@ class Structure(object):
         occ = kwargs['occ']
         wobble = kwargs['wobble']
 
-        unit_lengths = np.apply_along_axis(lambda x: np.amax(x) - np.amin(x),
-                                           0, self.cartesian['position'])
-        rows = []
-        rows.append(['', '', '%.4f' % unit_lengths[0],
-                     '%.4f' % unit_lengths[1], '%.4f' % unit_lengths[2]])
-        local_dict = {}
-        for ele in self.elements:
-            local_dict[ele] = PERIODIC_TABLE[ele]
-        for ent in self.cartesian:
-            rows.append(['', str(local_dict[ent['element']]),
-                         '%.4f' % (ent['position'][0] / unit_lengths[0]),
-                         '%.4f' % (ent['position'][1] / unit_lengths[1]),
-                         '%.4f' % (ent['position'][2] / unit_lengths[2]),
-                         '%.1f' % occ, '%.3f' % wobble])
+        unit_lengths = np.amax(self.cartesian_pos, axis=0) - \
+            np.amin(self.cartesian_pos, axis=0)
+        (uniq_codes, inverse) = np.unique(self.element_codes,
+                                          return_inverse=True)
+        numbers = np.array([PERIODIC_TABLE[sym] for sym in
+                            element_symbols(uniq_codes).tolist()],
+                           dtype=int)[inverse]
+        positions = (self.cartesian_pos / unit_lengths).T
+        header = ['%.4f' % length for length in unit_lengths]
+
+        # Columns are padded to their widest entry over the header and the
+        # atoms, as util.tabulate does; the first column is empty.
+        number_width = max([len(str(number)) for number in
+                            np.unique(numbers)] + [0])
+        widths = [max(len(header[i]), util.column_width(positions[i], '%.4f'))
+                  for i in range(3)]
+        header_line = '  ' + ' ' * number_width + '  ' + '  '.join(
+            [header[i].ljust(widths[i]) for i in range(3)])
+        row_format = '\n  %%-%dd  %%-%d.4f  %%-%d.4f  %%-%d.4f  ' % \
+            tuple([number_width] + widths) + '%.1f  %.3f' % (occ, wobble)
         out_name = path if path.split('.')[-1] == 'ems' else path + '.ems'
         with util.open_write_file(out_name, overwrite_protect) as out_file:
             out_file.write(self.comment + '\n')
-            out_file.write(util.tabulate(rows))
+            out_file.write(header_line)
+            util.write_rows(out_file, row_format,
+                            [numbers] + list(positions))
             out_file.write('\n  -1')
-            out_file.close()
         return
 
     def reconcile(self, according_to='C'):
         """Keep direct and cartesian fields of a Structure object consistent.
 
+        Atoms are sorted by element, then by position, and the other 
+        coordinates are marked stale, to be recalculated on next access. 
+        Arrays are only replaced when the order changes.
+
         Args:
-            according_to (str, optional): Description
+            according_to (str, optional): 'C' when the Cartesian positions 
+                are up to date, 'D' when the direct positions are.
 
         Returns:
-            TYPE: Description
+            (void): Does not return.
 
         Raises:
-            ValueError: Description
+            ValueError: Raised when according_to is neither 'C' nor 'D'.
         """
         if (according_to == 'C'):
-            self.cartesian.sort(order='element')
-            self.direct = copy.deepcopy(self.cartesian)
-            self.direct['position'] = np.dot(self.cartesian['position'],
-                                             np.linalg.inv(self.coordinates))
+            positions = self.cartesian_pos
         elif (according_to == 'D'):
-            self.direct.sort(order='element')
-            self.cartesian = copy.deepcopy(self.direct)
-            self.cartesian['position'] = np.dot(self.cartesian['position'],
-                                                self.coordinates)
+            positions = self.direct_pos
         else:
             raise ValueError('Argument according_to should either be' +
                              '"C" or "D".')
+        order = atom_order(positions, self.element_codes)
+        if np.any(order != np.arange(len(order))):
+            positions = positions[order]
+            self.element_codes = self.element_codes[order]
+        # Assigning the positions marks the other coordinates stale.
+        if (according_to == 'C'):
+            self.cartesian_pos = positions
+        else:
+            self.direct_pos = positions
         return
 
     def transform(self, trans_mat):
@@ -402,27 +631,75 @@ class Structure(object):
                 determinant of 1.
 
         Returns:
-            (void): Doew not return.
+            Structure obj: The transformed structure, sharing the direct 
+                positions and element codes of this one.
         """
         assert (np.linalg.det(trans_mat) - 1.0) < 1e-3
-        self.coordinates = np.dot(self.coordinates, np.transpose(trans_mat))
-        self.view_agls = np.dot(self.view_agls, np.transpose(trans_mat))
-        self.reconcile(according_to='D')
-        return
+        res = self.copy()
+        res.coordinates = np.dot(self.coordinates, np.transpose(trans_mat))
+        res.view_agls = read_only(np.dot(self.view_agls,
+                                         np.transpose(trans_mat)))
+        res.reconcile(according_to='D')
+        return res
 
-    def grow_to_supercell(self, lattice_vecs, max_atoms):
-        """Grow the current struct to a super cell to fill the new lattice box.
+    def grow_to_supercell(self, lattice_vecs, max_atoms, tiling='search',
+                          backend='numpy'):
+        """Grow a copy of the struct to a super cell to fill the new lattice 
+            box.
 
         Args:
             lattice_vecs (nparray): nparray of 3*3 representing 3 new lattice 
                 vectors.
             max_atoms (int): Maximum number of atoms.
+            tiling (str): Either 'search' to search image cells outwards from 
+                the original cell until max_atoms is exceeded, or 
+                'closed_form' to tile every image cell overlapping the new 
+                lattice box at once, keeping a single copy of atoms on the 
+                faces of the box.
+            backend (str): Backend of tile_images() with tiling 
+                'closed_form', either 'numpy' or 'numba'.
 
         Returns:
-            (void): Does not return.
+            Structure obj: The grown structure, sharing the view angles of 
+                this one.
 
         Raises:
-            ValueError: Raised when grown structure is empty.
+            ValueError: Raised when grown structure is empty, when it has more
+                than max_atoms atoms with tiling 'closed_form', or when tiling
+                is not known.
+        """
+        if tiling == 'search':
+            enlarged_pos, enlarged_codes = self.search_images(lattice_vecs,
+                                                              max_atoms)
+        elif tiling == 'closed_form':
+            enlarged_pos, enlarged_codes = self.tile_images(
+                lattice_vecs, max_atoms, backend=backend)
+        else:
+            raise ValueError('Supercell tiling %s not found.' % tiling)
+        if len(enlarged_pos) <= 0:
+            raise ValueError('Grown super-cell is empty')
+        # Replace the coordinate system and atom positions.
+        res = self.copy()
+        res.direct_pos = enlarged_pos
+        res.element_codes = enlarged_codes
+        res.coordinates = lattice_vecs
+        # Make the Cartesian coordinates consistent.
+        res.reconcile(according_to='D')
+        return res
+
+    def search_images(self, lattice_vecs, max_atoms):
+        """Searches image cells outwards from the original cell for atoms 
+            inside a new lattice box, until more than max_atoms are found.
+
+        Args:
+            lattice_vecs (nparray): nparray of 3*3 representing 3 new lattice 
+                vectors.
+            max_atoms (int): Maximum number of atoms.
+
+        Returns:
+            (nparray, nparray): Direct positions with respect to lattice_vecs 
+                (n * 3) and element codes (n) of the atoms found. Atoms on 
+                the faces of the box are kept on both sides.
         """
         # First calculate the inverse while strengthening the diagonal.
         new_coord_inv = np.linalg.inv(lattice_vecs + np.identity(3) * 1e-5)
@@ -438,42 +715,112 @@ class Structure(object):
             [1, 1, 1], [-1, -1, -1], [-1, -1, 1], [-1, 1, -1], [1, -1, -1]
         ])
         searched_pos = set()
-        enlarged_struct = []
-        while len(enlarged_struct) <= max_atoms and len(supercell_pos) > 0:
+        enlarged_pos = []
+        enlarged_codes = []
+        enlarged_count = 0
+        while enlarged_count <= max_atoms and len(supercell_pos) > 0:
             current_pos = supercell_pos.pop(0)
             if (tuple(current_pos.tolist()) in searched_pos):
                 # If we have searched the position, just skip.
                 continue
             searched_pos.add(tuple(current_pos.tolist()))
             shift_vector = np.dot(current_pos, self.coordinates)
-            shifted = copy.deepcopy(self.cartesian)
-            shifted['position'] += shift_vector
             # Convert the shifted vectors into direct with respect to the
             # new coordinate system given by lattice_vec
-            shifted['position'] = np.dot(shifted['position'], new_coord_inv)
+            shifted = np.dot(self.cartesian_pos + shift_vector, new_coord_inv)
             # Filter out the atoms that are contained by the new coordinate
             # system.
-            shifted = shifted[np.apply_along_axis(geom.valid_direct_vec,
-                                                  1, shifted['position'])]
-            if len(shifted) > 0:
-                if len(enlarged_struct) > 0:
-                    enlarged_struct = np.concatenate(
-                        (enlarged_struct, shifted))
-                else:
-                    enlarged_struct = shifted
+            inside = np.all(np.absolute(shifted - 0.5) < 0.5 + 1e-5, axis=1)
+            if np.any(inside):
+                enlarged_pos.append(shifted[inside])
+                enlarged_codes.append(self.element_codes[inside])
+                enlarged_count += np.count_nonzero(inside)
                 next_pos = map(lambda x: x + current_pos, search_dirs)
                 next_pos = [p for p in next_pos if not tuple(
                     p.tolist()) in searched_pos]
                 supercell_pos += next_pos
-        # Replace the coordinate system and atom positions.
-        self.direct = np.unique(enlarged_struct)
-        if len(self.direct) <= 0:
-            raise ValueError('Grown super-cell is empty')
-        self.direct.sort(order='element')
-        self.coordinates = lattice_vecs
-        # Make the Cartesian coordinates consistent.
-        self.reconcile(according_to='D')
-        return
+        if enlarged_count <= 0:
+            return (np.zeros((0, 3)), np.zeros(0, dtype=ELEMENT_CODE_TYPE))
+        # Drop atoms that are found more than once.
+        enlarged = np.unique(np.column_stack((
+            np.concatenate(enlarged_pos), np.concatenate(enlarged_codes))),
+            axis=0)
+        return (enlarged[:, 0:3], enlarged[:, 3].astype(ELEMENT_CODE_TYPE))
+
+    def tile_images(self, lattice_vecs, max_atoms, tol=1e-5, backend='numpy'):
+        """Tiles all image cells overlapping a new lattice box and keeps the 
+            atoms inside it.
+
+        Args:
+            lattice_vecs (nparray): nparray of 3*3 representing 3 new lattice 
+                vectors.
+            max_atoms (int): Maximum number of atoms.
+            tol (float): Tolerance, in direct coordinates of lattice_vecs, for 
+                atoms on the faces of the box.
+            backend (str): 'numpy' to place every atom of every image in one
+                array and mask it, or 'numba' to filter the image atoms in a 
+                compiled loop without the intermediate array.
+
+        Returns:
+            (nparray, nparray): Direct positions with respect to lattice_vecs 
+                (n * 3), wrapped into [-tol, 1 - tol), and element codes (n)
+                of the atoms inside the box.
+
+        Raises:
+            ValueError: Raised when the box holds more than max_atoms atoms.
+        """
+        expected = len(self.element_codes) * abs(
+            np.linalg.det(lattice_vecs) / np.linalg.det(self.coordinates))
+        if expected > max_atoms:
+            raise ValueError('Grown super-cell exceeds %d atoms.' % max_atoms)
+        # Maps direct coordinates of the current lattice to the new one.
+        to_new = np.dot(self.coordinates, np.linalg.inv(lattice_vecs))
+        # The corners of the new box in direct coordinates of the current 
+        # lattice bound the image cells that can reach into the box.
+        corners = np.dot(geom.cartesian_product(np.array([0., 1.]), 3),
+                         np.linalg.inv(to_new))
+        ranges = [np.arange(int(np.floor(lo)) - 1, int(np.ceil(hi)) + 1)
+                  for lo, hi in zip(corners.min(axis=0), corners.max(axis=0))]
+        images = np.stack(np.meshgrid(*ranges, indexing='ij'),
+                          axis=-1).reshape(-1, 3)
+        base = np.dot(self.direct_pos, to_new)
+        shifts = np.dot(images, to_new)
+        if backend == 'numba':
+            count = kernels.count_inside_loop(base, shifts, tol)
+            enlarged_pos = np.empty((count, 3))
+            atom_idx = np.empty(count, dtype=int)
+            kernels.fill_inside_loop(base, shifts, tol, enlarged_pos,
+                                     atom_idx)
+            enlarged_codes = self.element_codes[atom_idx]
+        else:
+            # Direct positions of every atom in every image, (image, atom, 3).
+            tiled = base[np.newaxis, :, :] + shifts[:, np.newaxis, :]
+            inside = np.all(np.absolute(tiled - 0.5) < 0.5 + tol,
+                            axis=2).ravel()
+            count = np.count_nonzero(inside)
+            enlarged_pos = np.empty((count, 3))
+            np.compress(inside, tiled.reshape(-1, 3), axis=0,
+                        out=enlarged_pos)
+            enlarged_codes = np.empty(count, dtype=ELEMENT_CODE_TYPE)
+            np.compress(inside, np.tile(self.element_codes, len(images)),
+                        out=enlarged_codes)
+        # Atoms on opposite faces of the box are periodic images of each
+        # other; wrap them onto the same side and keep the first copy. The 
+        # copies then differ by rounding only, so they are matched within 
+        # tol instead of by rounded keys that may split them. Only atoms on
+        # a face, now within tol of 0 on some axis, can have copies.
+        enlarged_pos -= np.floor(enlarged_pos + tol)
+        face = np.flatnonzero(np.any(enlarged_pos < tol, axis=1))
+        face_pos = enlarged_pos[face]
+        face_codes = enlarged_codes[face]
+        idx_1, idx_2 = geom.neighbor_pairs(face_pos, face_pos, tol)
+        copies = np.logical_and(idx_1 < idx_2,
+                                face_codes[idx_1] == face_codes[idx_2])
+        copies = np.logical_and(copies, np.all(np.absolute(
+            face_pos[idx_1] - face_pos[idx_2]) < tol, axis=1))
+        keep = np.ones(count, dtype=bool)
+        keep[face[idx_2[copies]]] = False
+        return (enlarged_pos[keep], enlarged_codes[keep])
 
     @staticmethod
     def combine_structures(struct_1, struct_2):
@@ -485,13 +832,17 @@ class Structure(object):
             struct_2 (Structure obj): Another Structure object.
 
         Returns:
-            Structure obj: The combined structure.
+            Structure obj: The combined structure, sharing the view angles of
+                struct_1. Neither input is changed.
         """
-        struct_1.direct['position'][:, 2] /= 2.0
-        struct_2.direct['position'][:, 2] /= 2.0
-        struct_2.direct['position'][:, 2] += 0.5
-        struct_1.direct = np.concatenate((struct_1.direct, struct_2.direct))
-        struct_1.coordinates[2] *= 2.0
-        struct_1.comment = struct_1.comment + '_' + struct_2.comment
-        struct_1.reconcile(according_to='D')
-        return struct_1
+        res = struct_1.copy()
+        # Squeeze both along c; struct_2 goes to the upper half.
+        res.direct_pos = np.concatenate((
+            struct_1.direct_pos * [1., 1., .5],
+            struct_2.direct_pos * [1., 1., .5] + [0., 0., .5]))
+        res.element_codes = np.concatenate((struct_1.element_codes,
+                                            struct_2.element_codes))
+        res.coordinates = struct_1.coordinates * [[1.], [1.], [2.]]
+        res.comment = struct_1.comment + '_' + struct_2.comment
+        res.reconcile(according_to='D')
+        return res
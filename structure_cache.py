@@ -0,0 +1,123 @@
+"""Binary cache of parsed input structures.
+
+The arrays of a parsed structure, along with its viewing angles, are saved
+as raw .npy files in a directory next to the input file, named after a hash
+of the input's content and the number of viewing angles. Later runs map the
+arrays with mmap_mode instead of parsing the input again, so processes that
+read the same input share the pages.
+
+For input file 'path/CdTe.vasp', the cache is 'path/CdTe.vasp.cache/<key>/'
+with files comment.npy, lattice.npy, view_agls.npy, positions.npy (direct),
+codes.npy, and symbols.npy and symbol_codes.npy, which give the element
+codes used in codes.npy.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from structure import Structure, element_codes, element_symbols
+
+
+def content_key(path, view_agl_count):
+    """Gives the cache key of an input file.
+
+    Args:
+        path (str): Path to the input file.
+        view_agl_count (int): Number of viewing angles.
+
+    Returns:
+        str: The SHA-1 of the file content, followed by view_agl_count.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return '%s_%d' % (digest.hexdigest(), view_agl_count)
+
+
+def save_structure(struct, directory):
+    """Saves the arrays of a structure into a cache entry.
+
+    The entry is written to a temporary directory first and then renamed, so
+    that concurrent runs never see a partial entry.
+
+    Args:
+        struct (Structure obj): The structure.
+        directory (str): Path of the cache entry.
+
+    Returns:
+        (void): Does not return.
+    """
+    parent = os.path.dirname(directory)
+    if not os.path.isdir(parent):
+        os.mkdir(parent)
+    temp = tempfile.mkdtemp(dir=parent)
+    try:
+        symbol_codes = np.unique(struct.element_codes)
+        arrays = {'comment': np.array(struct.comment),
+                  'lattice': struct.coordinates,
+                  'view_agls': struct.view_agls,
+                  'positions': struct.direct_pos,
+                  'codes': struct.element_codes,
+                  'symbols': element_symbols(symbol_codes),
+                  'symbol_codes': symbol_codes}
+        for (name, array) in arrays.items():
+            np.save(os.path.join(temp, name + '.npy'),
+                    np.ascontiguousarray(array))
+        os.rename(temp, directory)
+    finally:
+        # Left behind only when another run saved the entry first.
+        shutil.rmtree(temp, ignore_errors=True)
+
+
+def load_structure(directory):
+    """Loads a structure from a cache entry, mapping its arrays.
+
+    Args:
+        directory (str): Path of the cache entry.
+
+    Returns:
+        Structure obj: The structure, with read-only arrays.
+    """
+    def load(name):
+        return np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+
+    codes = load('codes')
+    symbol_codes = load('symbol_codes')
+    current_codes = element_codes(load('symbols'))
+    if not np.array_equal(current_codes, symbol_codes):
+        # Symbols unknown to this process got other codes: translate.
+        lookup = np.zeros(symbol_codes.max() + 1, dtype=codes.dtype)
+        lookup[symbol_codes] = current_codes
+        codes = lookup[codes]
+    return Structure.from_arrays(load('comment').item(), load('lattice'),
+                                 load('positions'), codes, load('view_agls'))
+
+
+def from_file(path, view_agl_count=10):
+    """Reads a structure through the cache next to its input file, parsing
+        the input and filling the cache on a miss.
+
+    Args:
+        path (str): Path to the input file.
+        view_agl_count (int, optional): Number of viewing angles searched and
+            recommended.
+
+    Returns:
+        Structure obj: The structure.
+    """
+    if not os.path.isfile(path):
+        return Structure.from_file(path, view_agl_count=view_agl_count)
+    directory = os.path.join(path + '.cache',
+                             content_key(path, int(view_agl_count)))
+    if os.path.isdir(directory):
+        return load_structure(directory)
+    struct = Structure.from_file(path, view_agl_count=view_agl_count)
+    try:
+        save_structure(struct, directory)
+    except (IOError, OSError) as e:
+        if not os.path.isdir(directory):
+            print('Structure cache not written: %s' % e)
+            return struct
+    return load_structure(directory)
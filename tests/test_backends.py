@@ -0,0 +1,116 @@
+"""Tests that the 'numpy' and 'numba' backends give identical structures.
+
+The Numba half is skipped when Numba is not installed. Run from the
+repository root with: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import collision_removal as coll_rmvl
+import kernels
+from structure import Structure
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+MIN_DIST_DICT = {('Cd', 'Te'): 3.0, ('Cd', 'Cd'): 4.0, ('Te', 'Te'): 4.0}
+
+# Multiples of the zinc blende cell giving skewed super-cell boxes.
+MULTIPLES = [np.diag([2, 2, 2]),
+             np.array([[1, 1, 0], [-1, 1, 0], [0, 0, 2]]),
+             np.array([[2, 1, 0], [0, 1, 1], [1, 0, 3]]),
+             np.array([[3, -1, 1], [1, 2, 0], [0, 1, 2]])]
+
+
+def zinc_blende():
+    """Builds a conventional cell of CdTe.
+
+    Returns:
+        Structure obj: The cell, with 8 atoms.
+    """
+    positions = np.array([[0., 0., 0.], [.5, .5, 0.], [.5, 0., .5],
+                          [0., .5, .5], [.25, .25, .25], [.75, .75, .25],
+                          [.75, .25, .75], [.25, .75, .75]])
+    return Structure('CdTe', 1.0, np.identity(3) * 6.48, positions,
+                     np.array(['Cd'] * 4 + ['Te'] * 4))
+
+
+def random_structure(seed, atom_count=400):
+    """Builds a structure of randomly placed atoms, dense enough to have
+        many collisions.
+
+    Args:
+        seed (int): Seed of the random number generator.
+        atom_count (int, optional): Number of atoms.
+
+    Returns:
+        Structure obj: The structure.
+    """
+    rng = np.random.RandomState(seed)
+    lattice = np.array([[20., 0., 0.], [6., 20., 0.], [2., 4., 20.]])
+    return Structure('random', 1.0, lattice, rng.rand(atom_count, 3),
+                     rng.choice(['Cd', 'Te'], atom_count))
+
+
+@unittest.skipIf(numba is None, 'Numba is not installed.')
+class BackendParityTest(unittest.TestCase):
+    """Runs each routine with both backends and compares the results."""
+
+    def setUp(self):
+        self.assertTrue(kernels.compile_kernels())
+
+    def assertSameStructure(self, struct_1, struct_2):
+        self.assertTrue(np.array_equal(struct_1.direct_pos,
+                                       struct_2.direct_pos))
+        self.assertTrue(np.array_equal(struct_1.element_codes,
+                                       struct_2.element_codes))
+
+    def grown(self, multiple, backend):
+        cell = zinc_blende()
+        return cell.grow_to_supercell(np.dot(multiple, cell.coordinates),
+                                      100000, tiling='closed_form',
+                                      backend=backend)
+
+    def test_grow_to_supercell(self):
+        for multiple in MULTIPLES:
+            self.assertSameStructure(self.grown(multiple, 'numpy'),
+                                     self.grown(multiple, 'numba'))
+
+    def test_remove_collision(self):
+        for fast in [True, False]:
+            for strategy in ['greedy', 'min_deletion']:
+                for (seed, multiple) in enumerate(MULTIPLES):
+                    results = []
+                    for backend in kernels.BACKENDS:
+                        struct = self.grown(multiple, backend)
+                        np.random.seed(seed)
+                        coll_rmvl.remove_collision(
+                            struct, 0.1, MIN_DIST_DICT, fast=fast,
+                            random_delete=seed % 2 == 1, strategy=strategy,
+                            backend=backend)
+                        results.append(struct)
+                    self.assertSameStructure(*results)
+
+    def test_min_image_remove_collision(self):
+        cutoffs = coll_rmvl.pair_cutoffs(MIN_DIST_DICT)
+        for seed in range(4):
+            results = []
+            for backend in kernels.BACKENDS:
+                struct = random_structure(seed)
+                np.random.seed(seed)
+                coll_rmvl.min_image_remove_collision(
+                    struct, cutoffs, random_delete=seed % 2 == 1,
+                    backend=backend)
+                results.append(struct)
+            self.assertLess(len(results[0].direct_pos), 400)
+            self.assertSameStructure(*results)
+
+
+if __name__ == '__main__':
+    unittest.main()
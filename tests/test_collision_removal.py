@@ -0,0 +1,67 @@
+"""Tests of the strategies that decide which colliding atoms to keep.
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+import collision_removal as coll_rmvl
+
+
+def random_collisions(rng, atom_count, pair_count):
+    """Draws a random graph of colliding atoms.
+
+    Args:
+        rng (RandomState obj): The random number generator.
+        atom_count (int): Number of atoms.
+        pair_count (int): Number of pairs drawn, before self pairs are
+            dropped.
+
+    Returns:
+        (nparray, nparray): The earlier and the later atom of each pair.
+    """
+    first = rng.randint(0, atom_count, pair_count)
+    second = rng.randint(0, atom_count, pair_count)
+    distinct = first != second
+    return (np.minimum(first, second)[distinct],
+            np.maximum(first, second)[distinct])
+
+
+class KeepAtomsTest(unittest.TestCase):
+    """Tests of keep_atoms() with each strategy."""
+
+    def test_kept_atoms_do_not_collide(self):
+        rng = np.random.RandomState(0)
+        for _ in range(100):
+            atom_count = rng.randint(2, 60)
+            (earlier, later) = random_collisions(rng, atom_count,
+                                                 3 * atom_count)
+            for strategy in ['greedy', 'min_deletion']:
+                keep = coll_rmvl.keep_atoms(atom_count, earlier, later,
+                                            strategy)
+                self.assertFalse(np.any(keep[earlier] & keep[later]))
+
+    def test_min_deletion_keeps_no_fewer_than_greedy(self):
+        rng = np.random.RandomState(1)
+        for _ in range(300):
+            atom_count = rng.randint(2, 60)
+            (earlier, later) = random_collisions(
+                rng, atom_count, rng.randint(0, 4 * atom_count))
+            greedy = coll_rmvl.keep_atoms(atom_count, earlier, later,
+                                          'greedy')
+            fewest = coll_rmvl.keep_atoms(atom_count, earlier, later,
+                                          'min_deletion')
+            self.assertGreaterEqual(np.sum(fewest), np.sum(greedy))
+
+    def test_unknown_strategy(self):
+        empty = np.zeros(0, dtype=int)
+        self.assertRaises(ValueError, coll_rmvl.keep_atoms, 3, empty, empty,
+                          'random')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Tests of growing Structure objects into super cells.
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from structure import Structure
+
+
+class TileImagesTest(unittest.TestCase):
+    """Tests of Structure.tile_images()."""
+
+    def test_one_copy_of_atoms_on_faces(self):
+        # Atoms half a tolerance off a face, where copies on the two faces 
+        # used to round to different keys.
+        tol = 1e-5
+        rng = np.random.RandomState(3)
+        for _ in range(100):
+            lattice = (np.diag(rng.uniform(2., 5., 3)) +
+                       rng.uniform(-.5, .5, (3, 3)) * np.tri(3, k=-1))
+            positions = rng.uniform(0., 1., (6, 3))
+            positions[:, rng.randint(3)] = (rng.randint(0, 3, 6) + .5) * tol
+            struct = Structure('test', 1.0, lattice, positions,
+                               np.array(['Cd', 'Te'] * 3))
+            multiple = np.diag(rng.randint(1, 4, 3))
+            multiple[0, 1] = rng.randint(-1, 2)
+            (pos, codes) = struct.tile_images(np.dot(multiple, lattice),
+                                              100000, tol)
+            self.assertEqual(len(pos), 6 * int(round(abs(
+                np.linalg.det(multiple)))))
+            self.assertTrue(np.all(pos >= -tol))
+            self.assertTrue(np.all(pos < 1. - tol))
+
+
+if __name__ == '__main__':
+    unittest.main()
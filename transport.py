@@ -0,0 +1,128 @@
+"""Moves Structure objects between processes through memory-mapped files.
+
+The lattice, view angles, direct positions and element codes of a structure
+are written once into a single file, and the receiving process maps that
+file read-only instead of unpickling the arrays. Only a StructureHandle,
+which names the file and the array sizes, is pickled. Files are created in a
+directory under /dev/shm when it exists, so that they stay in memory.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from structure import Structure, ELEMENT_CODE_TYPE
+
+
+class StructureHandle(object):
+    """A small picklable description of a structure written by
+        share_structure().
+
+    Attributes:
+        atom_count (int): Number of atoms.
+        comment (str): Description of the crystal structure.
+        path (str): Path to the file holding the arrays.
+        view_agl_count (int): Number of viewing angles.
+    """
+
+    def __init__(self, path, comment, atom_count, view_agl_count):
+        """Initializes a new StructureHandle object.
+
+        Args:
+            path (str): Path to the file holding the arrays.
+            comment (str): Description of the crystal structure.
+            atom_count (int): Number of atoms.
+            view_agl_count (int): Number of viewing angles.
+        """
+        self.path = path
+        self.comment = comment
+        self.atom_count = atom_count
+        self.view_agl_count = view_agl_count
+
+
+def make_directory():
+    """Creates a directory for the files of shared structures.
+
+    Returns:
+        str: Path to the new directory.
+    """
+    if os.path.isdir('/dev/shm'):
+        return tempfile.mkdtemp(prefix='genie_', dir='/dev/shm')
+    return tempfile.mkdtemp(prefix='genie_')
+
+
+def remove_directory(directory):
+    """Removes a directory made by make_directory() and the files in it.
+
+    Args:
+        directory (str): Path to the directory.
+
+    Returns:
+        (void): Does not return.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def share_structure(struct, directory):
+    """Writes the arrays of a structure into a new file.
+
+    Args:
+        struct (Structure obj): The structure.
+        directory (str): Directory made by make_directory().
+
+    Returns:
+        StructureHandle obj: Handle to pass to attach_structure().
+    """
+    (fd, path) = tempfile.mkstemp(suffix='.struct', dir=directory)
+    with os.fdopen(fd, 'wb') as out_file:
+        # All float arrays come first, so that every array stays aligned.
+        for array in [np.asarray(struct.coordinates, dtype=float),
+                      np.asarray(struct.view_agls, dtype=float),
+                      np.asarray(struct.direct_pos, dtype=float),
+                      np.asarray(struct.element_codes,
+                                 dtype=ELEMENT_CODE_TYPE)]:
+            out_file.write(np.ascontiguousarray(array).tobytes())
+    return StructureHandle(path, struct.comment, len(struct.element_codes),
+                           len(struct.view_agls))
+
+
+def remove_structure(handle):
+    """Removes the file of a shared structure. Processes that have mapped it
+        keep their mapping.
+
+    Args:
+        handle (StructureHandle obj): Handle given by share_structure().
+
+    Returns:
+        (void): Does not return.
+    """
+    os.remove(handle.path)
+
+
+def attach_structure(handle, remove=False):
+    """Maps the file of a shared structure and builds a Structure object on
+        it, without copying the arrays.
+
+    Args:
+        handle (StructureHandle obj): Handle given by share_structure().
+        remove (bool, optional): When set to True, removes the file once it
+            is mapped; the mapping stays valid until the structure is
+            released.
+
+    Returns:
+        Structure obj: The structure, with read-only arrays.
+    """
+    data = np.memmap(handle.path, dtype=np.uint8, mode='r')
+    if remove:
+        remove_structure(handle)
+    arrays = []
+    offset = 0
+    for (dtype, shape) in [(float, (3, 3)),
+                           (float, (handle.view_agl_count, 3)),
+                           (float, (handle.atom_count, 3)),
+                           (ELEMENT_CODE_TYPE, (handle.atom_count,))]:
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        arrays.append(data[offset:offset + size].view(dtype).reshape(shape))
+        offset += size
+    [coordinates, view_agls, direct_pos, codes] = arrays
+    return Structure.from_arrays(handle.comment, coordinates, direct_pos,
+                                 codes, view_agls)
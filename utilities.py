@@ -1,5 +1,6 @@
 import sys
 import os
+import numpy as np
 
 
 def tabulate_item(row, col_widths, sep="  "):
@@ -49,6 +50,53 @@ def tabulate(rows, sep="  "):
     return res
 
 
+def column_width(values, fmt):
+    """Finds the width of the widest of the values formatted with fmt, as 
+        tabulate() would pad the column.
+
+    Args:
+        values (nparray): Numbers in the column (n).
+        fmt (str): Format of one value, e.g. '%.4f'.
+
+    Returns:
+        int: Width of the column; 0 when values is empty.
+    """
+    # The formatted width only grows with the magnitude, so the largest 
+    # value and the most negative one (including -0.0) are the widest.
+    values = np.asarray(values)
+    negative = np.signbit(values)
+    candidates = []
+    if np.any(~negative):
+        candidates.append(values[~negative].max())
+    if np.any(negative):
+        candidates.append(values[negative].min())
+    return max([len(fmt % value) for value in candidates] + [0])
+
+
+def write_rows(out_file, row_format, columns, block_size=4096):
+    """Writes rows formatted from columns of values, a block of rows at a 
+        time, so that only one block is held as text.
+
+    Args:
+        out_file (file): The file to write to.
+        row_format (str): Format of one row, taking one value of each column
+            in order, e.g. '\\n%-2s  %.4f'.
+        columns (nparray list): Values of each column (n each).
+        block_size (int, optional): Number of rows formatted at once.
+
+    Returns:
+        (void): Does not return.
+    """
+    count = len(columns[0])
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        block = np.empty((stop - start, len(columns)), dtype=object)
+        for (i, column) in enumerate(columns):
+            block[:, i] = column[start:stop]
+        out_file.write((row_format * (stop - start)) %
+                       tuple(block.ravel().tolist()))
+
+
 def open_read_file(path, extension):
     """Opens a file to read with some handling.
 
@@ -0,0 +1,75 @@
+"""A background thread that writes output while the caller keeps computing.
+"""
+import Queue
+import threading
+import traceback
+
+
+class BackgroundWriter(object):
+    """Runs write tasks in order on a background thread.
+
+    At most max_pending tasks wait in the queue; submitting more blocks until
+    the thread catches up, so finished structures do not pile up in memory.
+    Errors of a task are appended to the error list given with it.
+    """
+
+    def __init__(self, max_pending):
+        """Starts the writer thread.
+
+        Args:
+            max_pending (int): Number of tasks that may wait in the queue.
+        """
+        self._queue = Queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """Runs tasks until the end marker None is taken from the queue.
+
+        Returns:
+            (void): Does not return.
+        """
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                (write, errors, label) = task
+                try:
+                    write()
+                except Exception:
+                    errors.append('%s: %s' % (label, traceback.format_exc()))
+            finally:
+                self._queue.task_done()
+
+    def submit(self, write, errors, label):
+        """Queues a write task, waiting while the queue is full.
+
+        Args:
+            write (function): The task, called without arguments.
+            errors (str list): List that a description of the error is
+                appended to when the task fails.
+            label (str): Prefix of the description of the error.
+
+        Returns:
+            (void): Does not return.
+        """
+        self._queue.put((write, errors, label))
+
+    def flush(self):
+        """Waits until all submitted tasks are done.
+
+        Returns:
+            (void): Does not return.
+        """
+        self._queue.join()
+
+    def close(self):
+        """Finishes all submitted tasks and stops the thread.
+
+        Returns:
+            (void): Does not return.
+        """
+        self._queue.put(None)
+        self._thread.join()